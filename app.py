@@ -2,12 +2,29 @@ import streamlit as st
 from openai import OpenAI
 import base64
 import json
-import requests
 import time
 import io
+import os
 import hashlib
 import qrcode
+import threading
+import csv
+import itertools
+import zipfile
+import logging
+import functools
+import textwrap
+import math
+import pandas as pd
+from PIL import Image, ImageOps
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import BytesIO
+from collections import OrderedDict, deque, namedtuple
+from string import Template
+from logging.handlers import RotatingFileHandler
+from auth import DEFAULT_ITERATIONS, hash_password, needs_rehash, verify_password
+from search import LibraryIndex
+from storage import GITEE_API, SHARD_SIZE, StorageConflict, StorageError, create_storage, make_session, stamp_item
 
 # 尝试导入 docx
 try:
@@ -48,7 +65,7 @@ def add_modern_light_style():
 
 add_modern_light_style()
 
-# ================= 🛠️ Gitee 核心函数 =================
+# ================= 🛠️ 存储核心函数 =================
 
 def get_gitee_config():
     return {
@@ -57,132 +74,439 @@ def get_gitee_config():
         "repo": st.secrets.get("GITEE_REPO", "")
     }
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+def get_setting(key, default):
+    try: return type(default)(st.secrets.get(key, default))
+    except Exception: return default
 
-def get_all_users():
-    """获取所有用户 (带自动纠错功能)"""
+# ================= ⏱️ 性能埋点 (PERF_DEBUG 打开时生效) =================
+
+class PerfRecorder:
+    """记录每次调用的耗时 / 字节数 / 缓存状态：按 rerun 分组给侧边栏面板看，同时逐条写入滚动 JSONL 日志。
+    线程池、后台写入队列里的调用没有 rerun 归属，单独放在 background 里"""
+    def __init__(self, enabled, log_path=None, max_bytes=5 << 20, backups=3, keep_runs=50):
+        self.enabled, self.keep_runs = enabled, keep_runs
+        self.local = threading.local()
+        self.runs = OrderedDict()   # run_id -> {"t0", "records"}
+        self.background = deque(maxlen=200)
+        self.lock = threading.Lock()
+        self.logger = None
+        if enabled and log_path:
+            self.logger = logging.getLogger(f"perf:{os.path.abspath(log_path)}")
+            if not self.logger.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                self.logger.addHandler(handler)
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+
+    def begin_run(self, session_id):
+        with self.lock:
+            run_id = f"{session_id}:{len(self.runs)}:{time.time():.3f}"
+            self.runs[run_id] = {"t0": time.perf_counter(), "records": []}
+            while len(self.runs) > self.keep_runs: self.runs.popitem(last=False)
+        self.local.run = run_id
+        return run_id
+
+    def record(self, name, seconds, nbytes=None, cache=None, **extra):
+        run_id = getattr(self.local, "run", None)
+        rec = {"ts": round(time.time(), 3), "run": run_id, "thread": threading.current_thread().name,
+               "name": name, "ms": round(seconds * 1000, 2), "bytes": nbytes, "cache": cache, **extra}
+        with self.lock:
+            run = self.runs.get(run_id)
+            (run["records"] if run else self.background).append(rec)
+        if self.logger:
+            try: self.logger.info(json.dumps(rec, ensure_ascii=False, default=str))
+            except Exception: pass
+
+    def run_view(self, run_id):
+        """(本次 rerun 已用秒数, 本次记录, 最近的后台记录)"""
+        with self.lock:
+            run = self.runs.get(run_id)
+            if not run: return 0.0, [], list(self.background)
+            return time.perf_counter() - run["t0"], list(run["records"]), list(self.background)
+
+    def http_hook(self, resp, *args, **kwargs):
+        """挂在 requests.Session 上，记录每个 Gitee 请求"""
+        path = resp.url.split("/contents/", 1)[-1].split("?", 1)[0]
+        self.record(f"http {resp.request.method}", resp.elapsed.total_seconds(), len(resp.content or b""),
+                    path=path, status=resp.status_code)
+
+@st.cache_resource
+def get_perf():
+    return PerfRecorder(get_setting("PERF_DEBUG", False), get_setting("PERF_LOG", "perf.jsonl") or None,
+                        max_bytes=get_setting("PERF_LOG_MAX_BYTES", 5 << 20), backups=get_setting("PERF_LOG_BACKUPS", 3))
+
+def cache_delta(before, after):
+    """比较缓存计数前后变化，得出这次调用是 hit / revalidated / miss"""
+    for key, label in (("misses", "miss"), ("revalidated", "revalidated"), ("hits", "hit")):
+        if after.get(key, 0) > before.get(key, 0): return label
+    return None
+
+def instrumented(name, describe=None, cache_stats=None):
+    """计时装饰器；PERF_DEBUG 关闭时直接调原函数。
+    describe(result) -> {"bytes": ..., 其他字段}；cache_stats() -> 缓存计数快照"""
+    perf = get_perf()
+    def wrap(fn):
+        if not perf.enabled: return fn
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            before = cache_stats() if cache_stats else None
+            t0, result, error = time.perf_counter(), None, None
+            try:
+                result = fn(*args, **kwargs)
+                return result
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                elapsed = time.perf_counter() - t0
+                info = {}
+                if describe and error is None:
+                    try: info = describe(result) or {}
+                    except Exception: pass
+                cache = cache_delta(before, cache_stats()) if cache_stats else None
+                perf.record(name, elapsed, info.pop("bytes", None), cache, **info, **({"error": error} if error else {}))
+        return inner
+    return wrap
+
+def json_size(obj):
+    return {"bytes": len(json.dumps(obj, ensure_ascii=False).encode("utf-8"))}
+
+def render_perf_panel():
+    """侧边栏：本次 rerun 的耗时分解 + 后台线程最近的记录"""
+    perf = get_perf()
+    if not perf.enabled: return
+    run_id = st.session_state.get("perf_run")
+    total, records, background = perf.run_view(run_id)
+    perf.record("rerun", total, calls=len(records))
+    with st.sidebar.expander(f"⏱️ 性能面板 · 本次 rerun {total * 1000:.0f} ms", expanded=False):
+        if records:
+            df = pd.DataFrame(records)
+            summary = df.groupby("name").agg(次数=("ms", "size"), 总ms=("ms", "sum"), 最大ms=("ms", "max"), 字节=("bytes", "sum"))
+            st.dataframe(summary.sort_values("总ms", ascending=False).round(1))
+            cols = [c for c in ("name", "ms", "bytes", "cache", "path", "status", "tokens", "error") if c in df.columns]
+            st.dataframe(df[cols], hide_index=True)
+        else: st.caption("本次 rerun 没有被记录的调用")
+        if background:
+            st.caption("后台线程 (最近 20 条)")
+            bg = pd.DataFrame(background[-20:])
+            st.dataframe(bg[[c for c in ("name", "ms", "bytes", "cache", "path", "status", "error") if c in bg.columns]], hide_index=True)
+
+# ================= 🔌 共享连接 (跨 rerun / 会话复用) =================
+
+@st.cache_resource
+def get_http_session():
+    """一个带连接池、重试退避的 requests.Session，省掉每次请求的 TCP+TLS 握手"""
+    session = make_session(retries=get_setting("HTTP_RETRIES", 3))
+    if get_perf().enabled: session.hooks["response"].append(get_perf().http_hook)
+    return session
+
+@st.cache_resource
+def get_llm_client(base_url, api_key):
+    """每个 (API 地址, key) 一个 OpenAI 客户端，底层 httpx 连接池随之复用"""
+    return OpenAI(api_key=api_key, base_url=base_url, timeout=get_setting("LLM_TIMEOUT", 120.0), max_retries=get_setting("LLM_RETRIES", 2))
+
+@st.cache_resource
+def get_storage():
+    """STORAGE_BACKEND = "gitee" (默认) | "sqlite"，本地后端可离线运行/压测"""
+    backend = get_setting("STORAGE_BACKEND", "gitee")
+    if backend == "sqlite":
+        return create_storage("sqlite", path=get_setting("SQLITE_PATH", "prompts.db"))
+    timeout = (get_setting("HTTP_CONNECT_TIMEOUT", 5.0), get_setting("HTTP_READ_TIMEOUT", 30.0))
+    return create_storage("gitee", api=get_setting("GITEE_API", GITEE_API), session=get_http_session(), timeout=timeout,
+                          shard_size=get_setting("SHARD_SIZE", SHARD_SIZE), **get_gitee_config())
+
+# ================= ⚡ 读缓存 (按 sha) =================
+
+class TTLCache:
+    """缓存文件的 sha (版本号) + 解析后的数据：TTL 内直接命中，过期后按 sha 复用解析结果，LRU 限制条目数"""
+    def __init__(self, ttl, max_entries):
+        self.ttl, self.max_entries = ttl, max_entries
+        self.entries = OrderedDict()
+        self.generations = {}   # key -> 失效次数，读之前记下，写回时对不上说明中途被 invalidate 过
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.revalidated = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry["ts"] < self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def reuse(self, key, sha):
+        """TTL 过期但远端 sha 未变时，复用已解析的数据，省掉 base64/JSON 解码"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and sha and entry["sha"] == sha:
+                self.revalidated += 1
+                return entry["data"]
+            return None
+
+    def generation(self, key):
+        with self.lock: return self.generations.get(key, 0)
+
+    def put(self, key, sha, data, generation=None):
+        """generation 不是读之前的值时丢弃：读到一半被写入失效的旧数据不能再放回缓存"""
+        with self.lock:
+            if generation is not None and self.generations.get(key, 0) != generation: return
+            self.entries[key] = {"sha": sha, "data": data, "ts": time.time()}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+
+    def peek(self, key):
+        """只看不计数，也不管是否过期"""
+        with self.lock: return self.entries.get(key)
+
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+            self.generations[key] = self.generations.get(key, 0) + 1
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated, "size": len(self.entries)}
+
+@st.cache_resource
+def get_data_cache():
+    return TTLCache(get_setting("CACHE_TTL", 60), get_setting("CACHE_MAX_ENTRIES", 256))
+
+def cached_read(key, reader):
+    """reader() 返回 (sha, loader)，走缓存；网络/解析失败不缓存"""
+    cache = get_data_cache()
+    entry = cache.get(key)
+    if entry: return entry["data"]
+    generation = cache.generation(key)
+    sha, loader = reader()
+    data = cache.reuse(key, sha)
+    if data is None: data = loader()
+    cache.put(key, sha, data, generation)
+    return data
+
+# ================= 📮 后台写入队列 =================
+
+class WriteQueue:
+    """后台合并写入：同一用户在 delay 秒内的增删合成一次提交，sha 冲突时重新读取并重放；
+    其他错误 (超时、5xx) 不丢操作，放回队列按退避时间重试"""
+    def __init__(self, storage, on_flush, delay=0.5, retries=3, max_backoff=60):
+        self.storage, self.on_flush, self.delay, self.retries = storage, on_flush, delay, retries
+        self.max_backoff = max_backoff
+        self.pending = {}   # username -> {"adds": [...], "deletes": {id, ...}}
+        self.inflight = {}  # username -> 正在提交的 ops，缓存失效之后才清掉
+        self.retry_at = {}  # username -> (下次可重试的时间, 连续失败次数)
+        self.status = {}    # username -> {"pending", "flushed", "failed", "error"}
+        self.cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True, name="write-queue").start()
+
+    def _status(self, username):
+        return self.status.setdefault(username, {"pending": 0, "flushed": 0, "failed": 0, "error": None})
+
+    @staticmethod
+    def _merge(ops, adds, deletes):
+        """把增删并进 ops：删的是还没写出去的新增就直接抵消，重复的 id 只算一次"""
+        known = {d["id"] for d in ops["adds"]}
+        ops["adds"].extend(d for d in adds if d["id"] not in known)
+        deletes = set(deletes)
+        queued = [d for d in ops["adds"] if d["id"] in deletes]
+        for d in queued: ops["adds"].remove(d)
+        ops["deletes"] |= deletes - {d["id"] for d in queued}
+
+    def _recount(self, username):
+        """待写入数 = 队列里 + 正在提交的，直接按结构重算，不会因为重复提交越记越多"""
+        ops = [o for o in (self.pending.get(username), self.inflight.get(username)) if o]
+        self._status(username)["pending"] = sum(len(o["adds"]) + len(o["deletes"]) for o in ops)
+
+    def submit(self, username, adds=(), deletes=()):
+        with self.cond:
+            self._merge(self.pending.setdefault(username, {"adds": [], "deletes": set()}), adds, deletes)
+            self._recount(username)
+            self.cond.notify()
+
+    def pending_view(self, username):
+        """返回 (待新增的条目, 待删除的 id)，包含正在提交的，用来让界面先看到自己的改动"""
+        with self.cond:
+            adds, deletes = [], set()
+            for ops in (self.inflight.get(username), self.pending.get(username)):
+                if ops: adds += ops["adds"]; deletes |= ops["deletes"]
+            return [d for d in adds if d["id"] not in deletes], deletes
+
+    def get_status(self, username):
+        with self.cond:
+            return dict(self._status(username))
+
+    def _ready(self, now):
+        return [u for u in self.pending if self.retry_at.get(u, (0, 0))[0] <= now]
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self._ready(time.time()):
+                    waits = [self.retry_at[u][0] - time.time() for u in self.pending if u in self.retry_at]
+                    self.cond.wait(max(0.05, min(waits)) if waits else None)
+            time.sleep(self.delay)  # 攒一小段时间，连续点击合并成一次提交
+            with self.cond:
+                batch = {u: self.pending.pop(u) for u in self._ready(time.time())}
+                self.inflight.update(batch)
+            for username, ops in batch.items():
+                self._commit(username, ops)
+
+    def _commit(self, username, ops):
+        n, error = len(ops["adds"]) + len(ops["deletes"]), None
+        for attempt in range(self.retries + 1):
+            try:
+                # commit 每次都会重新 GET 拿最新 sha，再把本批操作重放上去
+                self.storage.commit(username, adds=ops["adds"], deletes=ops["deletes"])
+                error = None
+                break
+            except StorageConflict as e:
+                error = f"sha 冲突，已重试 {attempt} 次: {e}"
+                time.sleep(0.2 * (attempt + 1))
+            except Exception as e:
+                error = str(e)
+                break
+        if not error: self.on_flush(username)
+        with self.cond:
+            s = self._status(username)
+            del self.inflight[username]
+            if error:
+                # 放回队列最前面，和这期间新提交的合并，退避后重试
+                fails = self.retry_at.get(username, (0, 0))[1] + 1
+                wait = min(self.max_backoff, 2 ** fails)
+                self.retry_at[username] = (time.time() + wait, fails)
+                merged = {"adds": [], "deletes": set()}
+                self._merge(merged, ops["adds"], ops["deletes"])
+                newer = self.pending.get(username)
+                if newer: self._merge(merged, newer["adds"], newer["deletes"])
+                self.pending[username] = merged
+                s["failed"] += 1
+                s["error"] = f"{error} ({wait}s 后自动重试)"
+            else:
+                self.retry_at.pop(username, None)
+                s["flushed"] += n
+                s["error"] = None
+            self._recount(username)
+            self.cond.notify_all()
+
+    def flush(self, timeout=10):
+        """等待队列写完 (退出/压测时用)"""
+        deadline = time.time() + timeout
+        with self.cond:
+            while (self.pending or any(s["pending"] for s in self.status.values())) and time.time() < deadline:
+                self.cond.wait(0.1)
+
+@st.cache_resource
+def get_write_queue():
+    cache = get_data_cache()
+    return WriteQueue(get_storage(), lambda u: cache.invalidate(get_data_key(u)), delay=get_setting("WRITE_DELAY", 0.5))
+
+@instrumented("get_user_hash", cache_stats=lambda: get_data_cache().stats())
+def get_user_hash(username):
+    """只读这个用户所在的分片 (带自动纠错功能)，不存在返回 None"""
     try:
-        cfg = get_gitee_config()
-        url = f"https://gitee.com/api/v5/repos/{cfg['owner']}/{cfg['repo']}/contents/users.json"
-        res = requests.get(url, params={"access_token": cfg['token']})
-        
-        if res.status_code == 200:
-            content = res.json()['content']
-            decoded = base64.b64decode(content).decode('utf-8')
-            data = json.loads(decoded)
-            
-            # 🛠️【核心修复】如果不小心存成了列表[]，强制转为字典{}
-            if isinstance(data, list):
-                return {} 
-            return data
-            
-        elif res.status_code == 404:
-            return {} 
-        return {}
-    except: return {}
+        storage = get_storage()
+        shard = storage.user_shard(username)
+        data = cached_read(f"users:{shard}", lambda: storage.read_users(shard))
+        # 🛠️【核心修复】如果不小心存成了列表[]，当作空
+        if not isinstance(data, dict):
+            return None
+        return data.get(username)
+    except: return None
 
-def register_new_user(username, password):
-    users = get_all_users()
-    
-    # 再次确保 users 是字典
-    if isinstance(users, list): users = {}
+@instrumented("check_login")
+def check_login(username, password):
+    """校验密码；旧的无盐 SHA-256 或迭代次数不是当前配置的，登录成功后顺手升级"""
+    record = get_user_hash(username) if username else None
+    if not verify_password(password, record): return False
+    iterations = get_setting("PASSWORD_ITERATIONS", DEFAULT_ITERATIONS)
+    if needs_rehash(record, iterations):
+        try:
+            storage = get_storage()
+            storage.set_user(username, hash_password(password, iterations))
+            get_data_cache().invalidate(f"users:{storage.user_shard(username)}")
+        except Exception: pass   # 升级失败不影响这次登录，下次再试
+    return True
 
-    if username in users:
-        return False, "❌ 用户名已存在"
-    
-    users[username] = hash_password(password)
-    
+def register_new_user(username, password):
+    # 不再先查一遍：add_user 自己读分片判断是否重名，冷启动只一次 GET + 一次 PUT
     try:
-        cfg = get_gitee_config()
-        url = f"https://gitee.com/api/v5/repos/{cfg['owner']}/{cfg['repo']}/contents/users.json"
-        
-        # 获取 sha 用于更新
-        sha = None
-        get_res = requests.get(url, params={"access_token": cfg['token']})
-        if get_res.status_code == 200:
-            sha = get_res.json()['sha']
-        
-        # 编码字典为JSON
-        new_text = json.dumps(users, ensure_ascii=False, indent=4)
-        new_b64 = base64.b64encode(new_text.encode('utf-8')).decode('utf-8')
-        
-        payload = {
-            "access_token": cfg['token'],
-            "content": new_b64,
-            "message": f"Register user {username}"
-        }
-        if sha: payload["sha"] = sha
-        
-        res = requests.put(url, json=payload)
-        
-        if res.status_code in [200, 201]:
-            return True, "✅ 注册成功！已自动登录"
-        else:
-            return False, f"注册失败: {res.text}"
+        storage = get_storage()
+        ok = storage.add_user(username, hash_password(password, get_setting("PASSWORD_ITERATIONS", DEFAULT_ITERATIONS)))
+        get_data_cache().invalidate(f"users:{storage.user_shard(username)}")
+        if ok: return True, "✅ 注册成功！已自动登录"
+        return False, "❌ 用户名已存在"
+    except StorageError as e:
+        return False, f"注册失败: {e}"
     except Exception as e:
         return False, str(e)
 
 # --- 数据存储系统 ---
 
-def get_user_filename(username):
-    return f"prompts_{username}.json"
+def get_data_key(username):
+    return f"prompts:{username}"
 
+@instrumented("load_data", describe=json_size, cache_stats=lambda: get_data_cache().stats())
 def load_data(username):
     try:
-        cfg = get_gitee_config()
-        if not cfg["token"]: return []
-        url = f"https://gitee.com/api/v5/repos/{cfg['owner']}/{cfg['repo']}/contents/{get_user_filename(username)}"
-        res = requests.get(url, params={"access_token": cfg['token']})
-        if res.status_code == 200:
-            return json.loads(base64.b64decode(res.json()['content']).decode('utf-8'))
-        return []
+        storage = get_storage()
+        if not storage.ready: return []
+        data = cached_read(get_data_key(username), lambda: storage.read_prompts(username))
+        # 还在队列里没写出去的改动先叠加显示 (新增标记为待同步，待删除的直接隐藏)
+        adds, deletes = get_write_queue().pending_view(username)
+        if not adds and not deletes: return data
+        # 提交刚完成、缓存已刷新时新增的条目可能已经在 data 里了
+        ids = {d.get('id') for d in data}
+        return [d for d in data if d.get('id') not in deletes] + [dict(d, _pending=True) for d in adds if d['id'] not in ids]
     except: return []
 
+def data_version(username):
+    """当前看到的数据版本：远端 sha + 队列里待同步的 id，用来给导出/索引做缓存 key"""
+    entry = get_data_cache().peek(get_data_key(username))
+    if not entry or not entry["sha"]: return None
+    adds, deletes = get_write_queue().pending_view(username)
+    if not adds and not deletes: return entry["sha"]
+    pending = ",".join([d["id"] for d in adds] + ["-" + i for i in sorted(deletes)])
+    return f"{entry['sha']}:{hashlib.sha1(pending.encode()).hexdigest()[:12]}"
+
+@instrumented("save_data_item")
 def save_data_item(new_item, username):
+    """加入后台写入队列后立即返回，不再阻塞界面"""
+    save_data_items([new_item], username)
+
+@instrumented("save_data_items")
+def save_data_items(new_items, username):
+    """多条一起入队，合并成一次提交"""
     try:
-        cfg = get_gitee_config()
-        url = f"https://gitee.com/api/v5/repos/{cfg['owner']}/{cfg['repo']}/contents/{get_user_filename(username)}"
-        res = requests.get(url, params={"access_token": cfg['token']})
-        sha, data_list = None, []
-        if res.status_code == 200:
-            sha = res.json()['sha']
-            try: data_list = json.loads(base64.b64decode(res.json()['content']).decode('utf-8'))
-            except: pass
-        data_list.append(new_item)
-        new_b64 = base64.b64encode(json.dumps(data_list, ensure_ascii=False, indent=4).encode('utf-8')).decode('utf-8')
-        payload = {"access_token": cfg['token'], "content": new_b64, "message": f"Add by {username}"}
-        if sha: payload["sha"] = sha
-        requests.put(url, json=payload)
-        st.toast(f"✅ 已保存到 {username} 的宝库")
-        time.sleep(1)
+        get_write_queue().submit(username, adds=[stamp_item(d) for d in new_items])
+        st.toast(f"⏳ 已加入 {username} 的宝库 ({len(new_items)} 条)，后台同步中")
     except Exception as e: st.error(f"保存出错: {e}")
 
-def delete_data_item(index, username):
+def delete_data_items(item_ids, username):
+    """按 id 删除 (可多条)，同一批合并成一次提交"""
     try:
-        cfg = get_gitee_config()
-        url = f"https://gitee.com/api/v5/repos/{cfg['owner']}/{cfg['repo']}/contents/{get_user_filename(username)}"
-        res = requests.get(url, params={"access_token": cfg['token']})
-        if res.status_code == 200:
-            info = res.json()
-            data = json.loads(base64.b64decode(info['content']).decode('utf-8'))
-            if 0 <= index < len(data):
-                data.pop(index)
-                new_b64 = base64.b64encode(json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')).decode('utf-8')
-                requests.put(url, json={"access_token": cfg['token'], "content": new_b64, "sha": info['sha'], "message": "Del"})
-                st.toast("🗑️ 删除成功")
-                time.sleep(1)
-                st.rerun()
-    except: pass
+        get_write_queue().submit(username, deletes=item_ids)
+        st.toast(f"🗑️ 已提交删除 {len(item_ids)} 条，后台同步中")
+    except Exception as e:
+        st.error(f"删除出错: {e}")
+        return
+    st.rerun()
+
+# ================= 📥 导出 =================
+
+def group_by_category(data):
+    """一次遍历按分类分组 (只放引用，不复制条目)，分类按名称排序"""
+    groups = {}
+    for d in data: groups.setdefault(d['category'], []).append(d)
+    return {cat: groups[cat] for cat in sorted(groups)}
 
+@instrumented("generate_word", describe=lambda bio: {"bytes": bio.getbuffer().nbytes} if bio else None)
 def generate_word(data):
     if not HAS_DOCX: return None
     doc = Document()
     doc.add_heading('🌟 我的 AI 提示词宝库', 0)
-    cats = sorted(list(set([d['category'] for d in data])))
-    for cat in cats:
+    for cat, items in group_by_category(data).items():
         doc.add_heading(f"📂 {cat}", level=1)
-        items = [d for d in data if d['category'] == cat]
         for item in items:
             doc.add_heading(item.get('desc', '无标题'), level=2)
             doc.add_paragraph(item['prompt']); doc.add_paragraph("-" * 30)
@@ -191,7 +515,497 @@ def generate_word(data):
     bio.seek(0)
     return bio
 
-def encode_image(file): return base64.b64encode(file.getvalue()).decode('utf-8')
+EXPORT_FIELDS = ["id", "category", "desc", "prompt", "created"]
+
+def _write_markdown(data, out):
+    out.write("# 🌟 我的 AI 提示词宝库\n")
+    for cat, items in group_by_category(data).items():
+        out.write(f"\n## 📂 {cat}\n")
+        for item in items:
+            out.write(f"\n### {item.get('desc') or '无标题'}\n\n```\n{item['prompt']}\n```\n")
+
+def _write_json(data, out):
+    # 逐条写，不在内存里再拼一份完整的 JSON 字符串
+    out.write("[")
+    for i, item in enumerate(data):
+        out.write(",\n" if i else "\n")
+        out.write(json.dumps({k: item.get(k) for k in EXPORT_FIELDS}, ensure_ascii=False))
+    out.write("\n]\n")
+
+def _write_csv(data, out):
+    writer = csv.DictWriter(out, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for item in data: writer.writerow(item)
+
+EXPORT_FORMATS = {
+    "Word": ("docx", "application/vnd.openxmlformats-officedocument.wordprocessingml.document", None),
+    "Markdown": ("md", "text/markdown", _write_markdown),
+    "JSON": ("json", "application/json", _write_json),
+    "CSV": ("csv", "text/csv", _write_csv),
+}
+
+def export_library(data, fmt):
+    """按格式导出，返回写好的 BytesIO 本身 (不再 getvalue() 复制一份)；文本格式直接流式写进去"""
+    if fmt == "Word": return generate_word(data)
+    buf = io.BytesIO()
+    out = io.TextIOWrapper(buf, encoding="utf-8-sig" if fmt == "CSV" else "utf-8", newline="")
+    EXPORT_FORMATS[fmt][2](data, out)
+    out.flush(); out.detach()
+    buf.seek(0)
+    return buf
+
+# ================= 🔎 宝库索引 =================
+
+@st.cache_resource
+def get_index_cache():
+    return ResultCache(get_setting("INDEX_CACHE_SIZE", 32))
+
+def get_library_index(username, data):
+    version = data_version(username)
+    if not version: return LibraryIndex(data)
+    key = f"{username}:{version}"
+    idx = get_index_cache().get(key)
+    if idx is None or idx.size != len(data):
+        idx = LibraryIndex(data)
+        get_index_cache().put(key, idx)
+    return idx
+
+@st.cache_resource
+def get_export_cache():
+    """(用户, 数据版本, 格式) -> 导出好的 BytesIO (download_button 直接读它)；版本不变就不重新生成"""
+    return ResultCache(get_setting("EXPORT_CACHE_SIZE", 8))
+
+def prepare_image(raw, max_edge=1024, fmt="JPEG", quality=85):
+    """解码图片字节，按最长边缩小后重新编码，返回 (b64, mime, 统计信息)；
+    重新编码反而更大且没有缩放时，直接发原图 (MIME 按真实格式)"""
+    t0 = time.time()
+    img = Image.open(io.BytesIO(raw))
+    orig_mime, orig_size = Image.MIME.get(img.format, "image/jpeg"), img.size
+    img.draft("RGB", (max_edge, max_edge))  # JPEG 直接按缩小后的尺寸解码，省时间
+    img = ImageOps.exif_transpose(img)  # 手机照片按 EXIF 方向摆正
+    img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    if fmt == "JPEG" and img.mode not in ("RGB", "L"):
+        bg = Image.new("RGB", img.size, "white")  # JPEG 没有透明通道，垫白底
+        bg.paste(img, mask=img.convert("RGBA").split()[-1])
+        img = bg
+    out = io.BytesIO()
+    img.save(out, format=fmt, quality=quality, optimize=True)
+    data, mime = out.getvalue(), Image.MIME[fmt]
+    if len(data) >= len(raw) and img.size == orig_size:
+        data, mime = raw, orig_mime
+    info = {"orig_bytes": len(raw), "sent_bytes": len(data), "encode_ms": (time.time() - t0) * 1000,
+            "size": img.size, "mime": mime}
+    return base64.b64encode(data).decode('utf-8'), mime, info
+
+def format_bytes(n):
+    return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.0f} KB"
+
+# ================= 🔍 图片反推 =================
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp")
+REVERSE_PROMPT = "输出格式：\nCN: [中文]\nEN: [MJ Prompt]"
+
+def load_uploaded_images(files, max_images, max_bytes):
+    """展开上传的图片和 zip 包，返回 ([(文件名, 字节)], 是否超出张数, [超过大小跳过的文件名])。
+    zip 成员先看声明的解压后大小再读 (zipfile 不会解出超过声明大小的数据)，凑够 max_images 张就不再往下解"""
+    images, skipped, truncated = [], [], False
+    for f in files:
+        if len(images) >= max_images: truncated = True; break
+        if f.name.lower().endswith(".zip"):
+            with zipfile.ZipFile(io.BytesIO(f.getvalue())) as zf:
+                for info in zf.infolist():
+                    name = info.filename
+                    if info.is_dir() or name.startswith("__MACOSX") or not name.lower().endswith(IMAGE_EXTS): continue
+                    if len(images) >= max_images: truncated = True; break
+                    if info.file_size > max_bytes: skipped.append(os.path.basename(name)); continue
+                    images.append((os.path.basename(name), zf.read(info)))
+        else:
+            images.append((f.name, f.getvalue()))
+    return images, truncated, skipped
+
+def make_thumbnail(raw, edge=256):
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(raw)))
+    img.thumbnail((edge, edge))
+    out = io.BytesIO()
+    img.convert("RGB").save(out, format="JPEG", quality=80)
+    return out.getvalue()
+
+def parse_reverse(raw):
+    """拆出 CN / EN 两段，没有 EN: 时返回 None"""
+    if "EN:" not in raw: return None
+    return raw.split("EN:")[0].replace("CN:", "").strip(), raw.split("EN:")[1].strip()
+
+@instrumented("chat vision", describe=lambda text: {"bytes": len(text.encode("utf-8"))})
+def call_vision(client, model, b64, mime):
+    resp = client.chat.completions.create(model=model, messages=[{"role":"user","content":[{"type":"text","text":REVERSE_PROMPT},{"type":"image_url","image_url":{"url":f"data:{mime};base64,{b64}"}}]}])
+    return resp.choices[0].message.content or ""
+
+def run_reverse_batch(images, client, model, limiter, cache, workers=4, max_edge=1024, fmt="JPEG", quality=85):
+    """并发反推多张图：按图片内容哈希去重，同一张图 (含以前传过的) 直接复用结果。
+    按完成先后逐张产出 {"names", "hash", "thumb", "cn", "en", "status", ...}"""
+    groups = OrderedDict()
+    for name, raw in images:
+        groups.setdefault(hashlib.sha256(raw).hexdigest(), {"names": [], "raw": raw})["names"].append(name)
+
+    def work(digest, raw):
+        key = f"vision:{model}:{digest}"
+        hit = cache.get(key)
+        if hit is not None: return dict(hit, status="⚡ 缓存", sent_bytes=0)
+        b64, mime, info = prepare_image(raw, max_edge, fmt, quality)
+        limiter.wait()
+        parsed = parse_reverse(call_vision(client, model, b64, mime))
+        if parsed is None: raise ValueError("模型没有按 CN/EN 格式返回")
+        result = {"cn": parsed[0], "en": parsed[1]}
+        cache.put(key, result)
+        return dict(result, status="✅", sent_bytes=info["sent_bytes"], encode_ms=info["encode_ms"], size=info["size"], mime=info["mime"])
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, digest, g["raw"]): digest for digest, g in groups.items()}
+        for fut in as_completed(futures):
+            digest = futures[fut]
+            g = groups[digest]
+            row = {"names": g["names"], "hash": digest, "orig_bytes": len(g["raw"]), "cn": "", "en": "", "sent_bytes": 0}
+            try:
+                row.update(fut.result())
+            except Exception as e:
+                row.update({"status": "❌", "error": str(e)})
+            try: row["thumb"] = make_thumbnail(g["raw"])
+            except Exception: row["thumb"] = None
+            yield row
+
+# ================= 🎛️ 模式与参数 =================
+
+RATIOS = ["--ar 16:9", "--ar 3:4", "--ar 1:1", "--ar 9:16"]
+
+# 每个参数: (控件 key, 标签, 请求里的字段名, 预设选项)
+PARAM_GROUPS = {
+    "效果图": {"caption": "🏗️ **效果图参数**", "params": [
+        ("v1", "视点", "View", ["人视", "半鸟瞰", "顶视", "虫视"]),
+        ("v2", "时刻", "Time", ["黄金时刻", "蓝调", "正午", "阴天", "雨夜"]),
+        ("v3", "环境", "Env", ["街道", "森林", "滨水", "雪景", "荒漠"]),
+        ("v4", "渲染", "Render", ["V-Ray", "UE5", "Lumion", "Corona"]),
+        ("v5", "材质", "Mat", ["混凝土", "玻璃", "木格栅", "涂料", "红砖"]),
+        ("v6", "氛围", "Mood", ["史诗", "宁静", "科幻", "极简"]),
+    ]},
+    "建筑设计": {"caption": "📐 **设计概念参数**", "params": [
+        ("d1", "图纸", "Type", ["草图", "轴测图", "平面图", "剖面图", "素模"]),
+        ("d2", "流派", "Style", ["扎哈", "柯布西耶", "安藤", "BIG", "解构"]),
+        ("d3", "尺度", "Scale", ["摩天楼", "博物馆", "独栋", "规划"]),
+        ("d4", "模型", "Mat", ["卡纸", "椴木", "亚克力", "铁丝"]),
+        ("d5", "背景", "BG", ["纯白", "网格纸", "牛皮纸"]),
+        ("d6", "细节", "Detail", ["高度详细", "概念抽象", "结构构造"]),
+    ]},
+    "通用": {"caption": None, "params": [
+        ("g1", "光线", "Light", ["自然光", "电影光", "霓虹"]),
+        ("g2", "视角", "Cam", ["广角", "微距", "鸟瞰"]),
+        ("g3", "氛围", "Mood", ["梦幻", "史诗", "阴郁"]),
+    ]},
+}
+
+# 所有模式共用同一段 system 前缀 (不随模式/参数变化)，服务商的前缀缓存才能命中；去掉了原来的缩进空白
+PLAN_SYS_MSG = textwrap.dedent("""
+    Generate Plan A (Faithful) and Plan B (Creative).
+    Format:
+    ===PLAN_A_CN===
+    [Chinese A]
+    ===PLAN_A_EN===
+    [English A]
+    ===PLAN_B_CN===
+    [Chinese B]
+    ===PLAN_B_EN===
+    [English B]
+    """).strip()
+
+# 请求模板：不变的部分在前、用户输入放最后，同一模式/参数反复生成时前缀一致
+REQUEST_TEMPLATES = {
+    "default": "Mode: $mode. Req: $details. User Input: $user_input",
+}
+
+# 出图参数后缀：Midjourney 风格带 --s/--c/--no，自然语言模式只保留画幅
+SUFFIX_TEMPLATES = {
+    "mj": " $ratio --s $stylize --c $chaos$negative",
+    "plain": " $ratio",
+}
+
+# 模式注册表：加模式只改这里。group 决定显示哪组参数，request/suffix 指向上面的模板
+MODE_REGISTRY = [
+    {"name": "🏗️ 建筑效果图 (ArchViz)", "group": "效果图"},
+    {"name": "📐 建筑设计 (Design Concept)", "group": "建筑设计"},
+    {"name": "标准模式 (MJ/SD)", "group": "通用"},
+    {"name": "自然语言 (Google)", "group": "通用", "suffix": "plain"},
+    {"name": "二次元 (Niji)", "group": "通用"},
+    {"name": "写实摄影", "group": "通用"},
+]
+MODES = [m["name"] for m in MODE_REGISTRY]
+
+ModeSpec = namedtuple("ModeSpec", "name caption params tags system request suffix")
+
+def compile_modes(registry, groups, system=PLAN_SYS_MSG):
+    """注册表 -> {模式名: ModeSpec}，模板在这里编译好，之后每次点击只做替换"""
+    requests_ = {k: Template(v) for k, v in REQUEST_TEMPLATES.items()}
+    suffixes = {k: Template(v) for k, v in SUFFIX_TEMPLATES.items()}
+    specs = {}
+    for m in registry:
+        group = groups[m["group"]]
+        specs[m["name"]] = ModeSpec(m["name"], group["caption"], group["params"], tuple(tag for _, _, tag, _ in group["params"]),
+                                    m.get("system", system), requests_[m.get("request", "default")], suffixes[m.get("suffix", "mj")])
+    return specs
+
+@st.cache_resource
+def get_mode_specs():
+    return compile_modes(MODE_REGISTRY, PARAM_GROUPS)
+
+def mode_spec(mode):
+    specs = get_mode_specs()
+    return specs.get(mode) or specs[MODES[0]]
+
+def build_request(user_input, mode, values):
+    """values: {字段名: 取值}，"不指定" 的跳过"""
+    spec = mode_spec(mode)
+    details = ", ".join(f"{tag}: {values[tag]}" for tag in spec.tags if values.get(tag, "不指定") != "不指定")
+    return spec.request.substitute(mode=mode, details=details, user_input=user_input)
+
+def build_suffix(ratio, mode, stylize, chaos, negative_prompt):
+    return mode_spec(mode).suffix.substitute(ratio=ratio, stylize=stylize, chaos=chaos,
+                                             negative=f" --no {negative_prompt}" if negative_prompt else "")
+
+# ================= 🗃️ 生成结果缓存 =================
+
+class ResultCache:
+    """按请求内容哈希缓存解析好的 A/B 方案：内存 LRU，配置了目录时每个 key 落一个 JSON 文件"""
+    def __init__(self, max_entries, path=None):
+        self.max_entries, self.path = max_entries, path
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+        if path: os.makedirs(path, exist_ok=True)
+
+    def _file(self, key):
+        # key 里可能带模型名 (Qwen/..., openai/gpt-4o)，哈希后再当文件名
+        return os.path.join(self.path, f"{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json")
+
+    def get(self, key):
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.path and os.path.exists(self._file(key)):
+            try:
+                with open(self._file(key), encoding="utf-8") as f: value = json.load(f)
+                self.put(key, value, persist=False)
+                with self.lock: self.hits += 1
+                return value
+            except (OSError, ValueError): pass
+        with self.lock: self.misses += 1
+        return None
+
+    def put(self, key, value, persist=True):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries: self.entries.popitem(last=False)
+        if self.path and persist:
+            try:
+                with open(self._file(key), "w", encoding="utf-8") as f: json.dump(value, f, ensure_ascii=False)
+            except OSError: pass
+
+@st.cache_resource
+def get_result_cache():
+    """GEN_CACHE_DIR 为空时只在内存里缓存"""
+    return ResultCache(get_setting("GEN_CACHE_SIZE", 512), get_setting("GEN_CACHE_DIR", "") or None)
+
+@st.cache_resource
+def get_vision_cache():
+    """按图片内容哈希缓存反推结果"""
+    path = get_setting("GEN_CACHE_DIR", "")
+    return ResultCache(get_setting("GEN_CACHE_SIZE", 512), os.path.join(path, "vision") if path else None)
+
+def generation_key(sys_msg, full_req, model, base_url):
+    """风格化/多样性/--no 等后缀在查缓存之后才拼上，不参与 key"""
+    raw = json.dumps([sys_msg, full_req, model, base_url], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+# ================= 🧩 方案 A/B 解析 =================
+
+PLAN_MARKERS = [("===PLAN_A_CN===", "p1_cn"), ("===PLAN_A_EN===", "p1_en"), ("===PLAN_B_CN===", "p2_cn"), ("===PLAN_B_EN===", "p2_en")]
+
+class PlanParser:
+    """增量解析 ===PLAN_X_XX=== 标记：可以逐 token 喂入，标记被拆在两个 token 之间也没关系"""
+    def __init__(self):
+        self.raw, self.tail, self.current = "", "", None
+        self.sections = {key: "" for _, key in PLAN_MARKERS}
+        self.seen = set()
+
+    def _emit(self, text):
+        if self.current and text: self.sections[self.current] += text
+
+    def feed(self, chunk):
+        self.raw += chunk
+        buf = self.tail + chunk
+        while True:
+            hits = [(buf.find(m), m, key) for m, key in PLAN_MARKERS if m in buf]
+            if not hits: break
+            i, m, key = min(hits)
+            self._emit(buf[:i])
+            self.current = key; self.seen.add(key)
+            buf = buf[i + len(m):]
+        # 末尾可能是半个标记，先留着等下一个 token
+        hold = max((n for m, _ in PLAN_MARKERS for n in range(1, len(m)) if buf.endswith(m[:n])), default=0)
+        self._emit(buf[:len(buf) - hold])
+        self.tail = buf[len(buf) - hold:]
+        return self.current
+
+    def result(self):
+        """最终结果；一个标记都没有时退回原文，缺了部分标记时只标记缺的那几段"""
+        self._emit(self.tail); self.tail = ""
+        if not self.seen:
+            raw = self.raw.strip()
+            return {"p1_cn": "解析失败", "p1_en": raw, "p2_cn": "解析失败", "p2_en": raw}, False
+        res = {key: self.sections[key].strip() if key in self.seen else ("解析失败" if key.endswith("cn") else "")
+               for _, key in PLAN_MARKERS}
+        return res, len(self.seen) == len(PLAN_MARKERS)
+
+def parse_plans(raw):
+    parser = PlanParser()
+    parser.feed(raw)
+    return parser.result()
+
+@instrumented("chat completion", describe=lambda r: {"bytes": sum(len(v.encode("utf-8")) for v in r[0].values()),
+                                                     "tokens": (r[2]["usage"] or {}).get("total"), "ttft_ms": round(r[2]["ttft"] * 1000, 1)})
+def run_generation(client, model, sys_msg, full_req, stream=True, on_update=None):
+    """调用文本模型并解析 A/B 方案；stream 时每收到 token 回调 on_update(sections)。
+    返回 (结果, 是否完整解析, {"ttft": 首字时间, "total": 总耗时, "usage": token 用量或 None})"""
+    messages = [{"role": "system", "content": sys_msg}, {"role": "user", "content": full_req}]
+    parser, t0, ttft, usage = PlanParser(), time.time(), None, None
+    if stream:
+        # include_usage：OpenAI 兼容接口会在最后多发一个 choices 为空、只带用量的 chunk；不认这个参数的服务商可以用 STREAM_USAGE 关掉
+        extra = {"stream_options": {"include_usage": True}} if get_setting("STREAM_USAGE", True) else {}
+        for chunk in client.chat.completions.create(model=model, messages=messages, stream=True, **extra):
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices: continue
+            text = chunk.choices[0].delta.content
+            if not text: continue
+            parser.feed(text)
+            if ttft is None and any(parser.sections.values()): ttft = time.time() - t0
+            if on_update: on_update(parser.sections)
+    else:
+        resp = client.chat.completions.create(model=model, messages=messages)
+        usage = getattr(resp, "usage", None)
+        parser.feed(resp.choices[0].message.content or "")
+    total = time.time() - t0
+    res, ok = parser.result()
+    if usage is not None:
+        usage = {"prompt": usage.prompt_tokens, "completion": usage.completion_tokens, "total": usage.total_tokens}
+    return res, ok, {"ttft": ttft if ttft is not None else total, "total": total, "usage": usage}
+
+# ================= 📦 批量生成 =================
+
+class RateLimiter:
+    """按固定间隔放行：同一个 API 地址每分钟最多 rpm 个请求，空闲后允许先突发 burst 个 (rpm<=0 不限速)"""
+    def __init__(self, rpm, burst=1):
+        self.interval = 60.0 / rpm if rpm > 0 else 0.0
+        self.burst = max(1, burst)
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            at = max(now - (self.burst - 1) * self.interval, self.next_at)
+            self.next_at = at + self.interval
+        if at > now: time.sleep(at - now)
+
+@st.cache_resource
+def get_rate_limiter(base_url):
+    return RateLimiter(get_setting("RATE_LIMIT_RPM", 60), get_setting("RATE_LIMIT_BURST", 4))
+
+def read_batch_inputs(text, upload=None):
+    """粘贴的每一行 + 上传的 TXT (每行一个) / CSV (input 列，没有就取第一列)"""
+    lines = [l.strip() for l in (text or "").splitlines()]
+    if upload is not None:
+        content = upload.getvalue().decode("utf-8-sig", errors="ignore")
+        if upload.name.lower().endswith(".csv"):
+            rows = list(csv.reader(io.StringIO(content)))
+            col = 0
+            if rows and "input" in [c.strip().lower() for c in rows[0]]:
+                col = [c.strip().lower() for c in rows[0]].index("input"); rows = rows[1:]
+            lines += [r[col].strip() for r in rows if len(r) > col]
+        else:
+            lines += [l.strip() for l in content.splitlines()]
+    return [l for l in lines if l]
+
+def count_batch_jobs(inputs, mode, grid):
+    """不展开组合，直接算 输入数 × 各参数选中个数 的乘积"""
+    return len(inputs) * math.prod(len(grid.get(tag) or ["不指定"]) for tag in mode_spec(mode).tags)
+
+def build_batch_jobs(inputs, mode, grid):
+    """按需产出 输入 × 各参数选中值 的笛卡尔积；grid: {字段名: [选中值]}，没选的按 不指定 处理"""
+    tags = mode_spec(mode).tags
+    for user_input in inputs:
+        for combo in itertools.product(*[grid.get(tag) or ["不指定"] for tag in tags]):
+            values = dict(zip(tags, combo))
+            yield {"input": user_input, "params": ", ".join(f"{t}: {v}" for t, v in values.items() if v != "不指定"),
+                   "full_req": build_request(user_input, mode, values)}
+
+def run_batch(jobs, client, model, base_url, limiter, cache, suffix, workers=4, sys_msg=PLAN_SYS_MSG):
+    """线程池并发生成，按完成先后逐行产出；命中结果缓存的不调用模型。
+    线程里不碰 st.*，缓存/限速器由调用方传进来"""
+    def work(job):
+        t0 = time.time()
+        key = generation_key(sys_msg, job["full_req"], model, base_url)
+        plans = cache.get(key)
+        cached, ok = plans is not None, True
+        if not cached:
+            limiter.wait()
+            plans, ok, _ = run_generation(client, model, sys_msg, job["full_req"], stream=False)
+            if ok: cache.put(key, plans)
+        return plans, ok, cached, time.time() - t0
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(work, job): job for job in jobs}
+        for fut in as_completed(futures):
+            job = futures[fut]
+            row = {"输入": job["input"], "参数": job["params"]}
+            try:
+                plans, ok, cached, elapsed = fut.result()
+                row.update({"状态": "⚡ 缓存" if cached else ("✅" if ok else "⚠️ 解析不完整"), "耗时(s)": round(elapsed, 2),
+                            "A_中文": plans["p1_cn"], "A_EN": plans["p1_en"] + suffix,
+                            "B_中文": plans["p2_cn"], "B_EN": plans["p2_en"] + suffix})
+            except Exception as e:
+                row.update({"状态": f"❌ {e}", "耗时(s)": None, "A_中文": "", "A_EN": "", "B_中文": "", "B_EN": ""})
+            yield row
+
+# ================= 🆚 多模型对比 =================
+
+def parse_compare_targets(text, default_base_url):
+    """每行一个模型，可写成 模型@API地址 来对比不同服务商；重复的去掉"""
+    targets = []
+    for line in (text or "").splitlines():
+        model, _, url = line.strip().partition("@")
+        target = (model.strip(), url.strip() or default_base_url)
+        if target[0] and target not in targets: targets.append(target)
+    return targets
+
+def run_comparison(targets, clients, limiters, sys_msg, full_req):
+    """同一个请求同时发给所有模型，按完成先后逐个产出，总耗时≈最慢的那个。
+    clients/limiters 按 API 地址由调用方建好传进来，线程里不碰 st.*"""
+    def work(model, url):
+        limiters[url].wait()
+        return run_generation(clients[url], model, sys_msg, full_req, stream=False)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+        futures = {pool.submit(work, model, url): (model, url) for model, url in targets}
+        for fut in as_completed(futures):
+            model, url = futures[fut]
+            row = {"model": model, "base_url": url}
+            try:
+                plans, ok, timing = fut.result()
+                row.update({"plans": plans, "parsed": ok, "timing": timing, "error": None})
+            except Exception as e:
+                row.update({"plans": None, "parsed": False, "timing": None, "error": str(e)})
+            yield row
 
 def custom_select(label, options, key_suffix):
     selected = st.selectbox(label, ["不指定"] + options + ["📝 自定义输入..."], key=f"sel_{key_suffix}")
@@ -200,6 +1014,7 @@ def custom_select(label, options, key_suffix):
         return val if val else "不指定"
     return selected
 
+@instrumented("generate_qr_code", describe=lambda png: {"bytes": len(png)})
 def generate_qr_code(url):
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(url)
@@ -211,6 +1026,9 @@ def generate_qr_code(url):
 
 # ================= 🚀 初始化 =================
 if "current_user" not in st.session_state: st.session_state.current_user = None
+if get_perf().enabled:
+    if "perf_sid" not in st.session_state: st.session_state.perf_sid = hashlib.sha1(os.urandom(8)).hexdigest()[:8]
+    st.session_state.perf_run = get_perf().begin_run(st.session_state.perf_sid)
 if "last_results" not in st.session_state: st.session_state.last_results = None
 
 # URL 自动登录逻辑
@@ -219,11 +1037,9 @@ if not st.session_state.current_user:
     if "u" in params and "p" in params:
         u_arg = params["u"]
         p_arg = params["p"]
-        users_db = get_all_users()
         try:
             decoded_p = base64.b64decode(p_arg).decode('utf-8')
-            hashed_p = hash_password(decoded_p)
-            if u_arg in users_db and users_db[u_arg] == hashed_p:
+            if check_login(u_arg, decoded_p):
                 st.session_state.current_user = u_arg
                 st.toast(f"🎉 扫码登录成功！欢迎 {u_arg}")
         except: pass
@@ -240,18 +1056,24 @@ with st.sidebar:
             try:
                 confirm_pass = st.text_input("验证当前密码生成", type="password")
                 if confirm_pass:
-                    users_db = get_all_users()
-                    if users_db.get(st.session_state.current_user) == hash_password(confirm_pass):
-                        b64_pass = base64.b64encode(confirm_pass.encode()).decode()
-                        app_url = "https://ai-prompt-app-gxjdrkrdhwkzaitakk9yri.streamlit.app" # 这里可以换成你具体的app地址
-                        login_link = f"{app_url}?u={st.session_state.current_user}&p={b64_pass}"
-                        qr_img = generate_qr_code(login_link)
-                        st.image(qr_img, caption="微信扫一扫，免密直连")
+                    # 校验结果和二维码按 (用户, 密码摘要) 存在会话里，之后每次 rerun 不再跑 KDF / 重新出图
+                    qr_key = (st.session_state.current_user, hashlib.sha256(confirm_pass.encode()).hexdigest())
+                    qr_cache = st.session_state.get("qr_cache")
+                    if not qr_cache or qr_cache[0] != qr_key:
+                        qr_img = None
+                        if verify_password(confirm_pass, get_user_hash(st.session_state.current_user)):
+                            b64_pass = base64.b64encode(confirm_pass.encode()).decode()
+                            app_url = "https://ai-prompt-app-gxjdrkrdhwkzaitakk9yri.streamlit.app" # 这里可以换成你具体的app地址
+                            login_link = f"{app_url}?u={st.session_state.current_user}&p={b64_pass}"
+                            qr_img = generate_qr_code(login_link)
+                        qr_cache = st.session_state.qr_cache = (qr_key, qr_img)
+                    if qr_cache[1]: st.image(qr_cache[1], caption="微信扫一扫，免密直连")
                     else: st.error("密码错误")
             except: pass
 
         if st.button("退出登录"):
             st.session_state.current_user = None
+            st.session_state.pop("qr_cache", None)
             st.rerun()
     else:
         auth_mode = st.radio("选择模式", ["登录", "注册新账号"], horizontal=True)
@@ -260,9 +1082,7 @@ with st.sidebar:
         
         if auth_mode == "登录":
             if st.button("登录", type="primary"):
-                users_db = get_all_users()
-                hashed_pw = hash_password(user_input_pass)
-                if user_input_name in users_db and users_db[user_input_name] == hashed_pw:
+                if check_login(user_input_name, user_input_pass):
                     st.session_state.current_user = user_input_name
                     st.success("✅ 登录成功！")
                     time.sleep(0.5)
@@ -286,12 +1106,21 @@ with st.sidebar:
     base_url = st.text_input("API 地址", value="https://hk-api.gptbest.vip/v1")
     text_model = st.text_input("文本模型", value="deepseek-chat")
     vision_model = st.text_input("视觉模型", value="gpt-4o-mini")
+    cs = get_data_cache().stats()
+    st.caption(f"⚡ 缓存 命中 {cs['hits']} · 未命中 {cs['misses']} · sha复用 {cs['revalidated']} · 条目 {cs['size']}")
+    rc = get_result_cache()
+    st.caption(f"🗃️ 生成缓存 命中 {rc.hits} · 未命中 {rc.misses}")
+    if st.session_state.current_user:
+        ws = get_write_queue().get_status(st.session_state.current_user)
+        st.caption(f"☁️ 同步 待写入 {ws['pending']} · 已写入 {ws['flushed']} · 失败 {ws['failed']}")
+        if ws["error"]: st.caption(f"⚠️ 最近一次同步失败: {ws['error']}")
 
 # ================= 🏗️ 主界面 =================
 st.markdown("# 🍊 AI Prompt Wizard <small>Pro</small>", unsafe_allow_html=True)
 
 if not st.session_state.current_user:
     st.info("👋 欢迎！请在左侧 **登录** 或 **注册**。")
+    render_perf_panel()
     st.stop()
 
 tab1, tab2, tab3 = st.tabs(["📝 生成提示词", "🖼️ 图片反推", "🌟 我的云端宝库"])
@@ -300,99 +1129,71 @@ tab1, tab2, tab3 = st.tabs(["📝 生成提示词", "🖼️ 图片反推", "
 with tab1:
     user_input = st.text_area("输入", height=100, label_visibility="collapsed", placeholder="例如：一个极简风格的白色美术馆...")
     c1, c2 = st.columns(2)
-    with c1: ratio = st.selectbox("画幅", ["--ar 16:9", "--ar 3:4", "--ar 1:1", "--ar 9:16"])
-    with c2: mode = st.selectbox("模式", ["🏗️ 建筑效果图 (ArchViz)", "📐 建筑设计 (Design Concept)", "标准模式 (MJ/SD)", "自然语言 (Google)", "二次元 (Niji)", "写实摄影"])
+    with c1: ratio = st.selectbox("画幅", RATIOS)
+    with c2: mode = st.selectbox("模式", MODES)
 
     with st.expander("🎨 高级参数配置 (支持自定义)", expanded=True):
-        if "效果图" in mode:
-            st.caption("🏗️ **效果图参数**")
-            ac1, ac2, ac3 = st.columns(3)
-            with ac1: viz_view = custom_select("视点", ["人视", "半鸟瞰", "顶视", "虫视"], "v1")
-            with ac2: viz_time = custom_select("时刻", ["黄金时刻", "蓝调", "正午", "阴天", "雨夜"], "v2")
-            with ac3: viz_env = custom_select("环境", ["街道", "森林", "滨水", "雪景", "荒漠"], "v3")
-            ac4, ac5, ac6 = st.columns(3)
-            with ac4: viz_render = custom_select("渲染", ["V-Ray", "UE5", "Lumion", "Corona"], "v4")
-            with ac5: viz_mat = custom_select("材质", ["混凝土", "玻璃", "木格栅", "涂料", "红砖"], "v5")
-            with ac6: viz_mood = custom_select("氛围", ["史诗", "宁静", "科幻", "极简"], "v6")
-        elif "建筑设计" in mode:
-            st.caption("📐 **设计概念参数**")
-            d1, d2, d3 = st.columns(3)
-            with d1: des_type = custom_select("图纸", ["草图", "轴测图", "平面图", "剖面图", "素模"], "d1")
-            with d2: des_style = custom_select("流派", ["扎哈", "柯布西耶", "安藤", "BIG", "解构"], "d2")
-            with d3: des_scale = custom_select("尺度", ["摩天楼", "博物馆", "独栋", "规划"], "d3")
-            d4, d5, d6 = st.columns(3)
-            with d4: des_mat = custom_select("模型", ["卡纸", "椴木", "亚克力", "铁丝"], "d4")
-            with d5: des_bg = custom_select("背景", ["纯白", "网格纸", "牛皮纸"], "d5")
-            with d6: des_detail = custom_select("细节", ["高度详细", "概念抽象", "结构构造"], "d6")
-        else:
-            col_a, col_b, col_c = st.columns(3)
-            with col_a: lighting = custom_select("光线", ["自然光", "电影光", "霓虹"], "g1")
-            with col_b: camera = custom_select("视角", ["广角", "微距", "鸟瞰"], "g2")
-            with col_c: mood = custom_select("氛围", ["梦幻", "史诗", "阴郁"], "g3")
+        spec = mode_spec(mode)
+        if spec.caption: st.caption(spec.caption)
+        param_values = {}
+        for row in range(0, len(spec.params), 3):
+            for col, (key, label, tag, options) in zip(st.columns(3), spec.params[row:row + 3]):
+                with col: param_values[tag] = custom_select(label, options, key)
         
         st.markdown("---")
         mp1, mp2 = st.columns(2)
         with mp1: stylize = st.slider("风格化 (--s)", 0, 1000, 250)
         with mp2: chaos = st.slider("多样性 (--c)", 0, 100, 0)
         negative_prompt = st.text_input("🚫 负面词 (--no)", value="text, watermark, blurry, low quality")
+        use_stream = st.toggle("⚡ 流式输出", value=True)
 
-    if st.button("🚀 立即生成", type="primary"):
+    g1, g2 = st.columns([3, 1])
+    with g1: gen = st.button("🚀 立即生成", type="primary")
+    with g2: regen = st.button("🔄 重新生成", help="跳过缓存，强制重新请求模型")
+    if gen or regen:
         try:
-            client = OpenAI(api_key=st.secrets["API_KEY"], base_url=base_url)
-            details = []
-            if "效果图" in mode:
-                if viz_view != "不指定": details.append(f"View: {viz_view}")
-                if viz_time != "不指定": details.append(f"Time: {viz_time}")
-                if viz_env != "不指定": details.append(f"Env: {viz_env}")
-                if viz_render != "不指定": details.append(f"Render: {viz_render}")
-                if viz_mat != "不指定": details.append(f"Mat: {viz_mat}")
-                if viz_mood != "不指定": details.append(f"Mood: {viz_mood}")
-            elif "建筑设计" in mode:
-                if des_type != "不指定": details.append(f"Type: {des_type}")
-                if des_style != "不指定": details.append(f"Style: {des_style}")
-                if des_scale != "不指定": details.append(f"Scale: {des_scale}")
-                if des_mat != "不指定": details.append(f"Mat: {des_mat}")
-                if des_bg != "不指定": details.append(f"BG: {des_bg}")
-                if des_detail != "不指定": details.append(f"Detail: {des_detail}")
+            sys_msg, full_req = spec.system, build_request(user_input, mode, param_values)
+            gen_key = generation_key(sys_msg, full_req, text_model, base_url)
+            cached = None if regen else get_result_cache().get(gen_key)
+            if cached:
+                plans, ok, timing = cached, True, {"ttft": 0.0, "total": 0.0, "cached": True}
             else:
-                if lighting != "不指定": details.append(f"Light: {lighting}")
-                if camera != "不指定": details.append(f"Cam: {camera}")
-                if mood != "不指定": details.append(f"Mood: {mood}")
-
-            sys_msg = """
-            Generate Plan A (Faithful) and Plan B (Creative). 
-            Format:
-            ===PLAN_A_CN===
-            [Chinese A]
-            ===PLAN_A_EN===
-            [English A]
-            ===PLAN_B_CN===
-            [Chinese B]
-            ===PLAN_B_EN===
-            [English B]
-            """
-            full_req = f"User Input: {user_input}. Req: {', '.join(details)}. Mode: {mode}"
-            
-            with st.spinner('AI 构思中...'):
-                resp = client.chat.completions.create(model=text_model, messages=[{"role":"system","content":sys_msg}, {"role":"user","content":full_req}])
-                raw = resp.choices[0].message.content
-                try:
-                    p1_cn = raw.split("===PLAN_A_EN===")[0].replace("===PLAN_A_CN===", "").strip()
-                    p1_en = raw.split("===PLAN_B_CN===")[0].split("===PLAN_A_EN===")[1].strip()
-                    p2_cn = raw.split("===PLAN_B_EN===")[0].split("===PLAN_B_CN===")[1].strip()
-                    p2_en = raw.split("===PLAN_B_EN===")[1].strip()
-                except: p1_cn, p1_en, p2_cn, p2_en = "解析失败", raw, "解析失败", raw
-                
-                suffix = f" {ratio.split(' ')[0]}"
-                if "自然语言" not in mode:
-                    suffix += f" --s {stylize} --c {chaos}"
-                    if negative_prompt: suffix += f" --no {negative_prompt}"
-                st.session_state.last_results = {"p1_cn": p1_cn, "p1_en": p1_en + suffix, "p2_cn": p2_cn, "p2_en": p2_en + suffix}
+                client = get_llm_client(base_url, st.secrets["API_KEY"])
+                if use_stream:
+                    # 流式：每个方案一收到 token 就渲染到对应的列里
+                    live = st.empty()
+                    with live.container():
+                        st.divider()
+                        la, lb = st.columns(2)
+                        with la: st.markdown("#### 🅰️ 方案 A"); slots = {"p1_cn": st.empty(), "p1_en": st.empty()}
+                        with lb: st.markdown("#### 🅱️ 方案 B"); slots.update({"p2_cn": st.empty(), "p2_en": st.empty()})
+                    last_push = [0.0]
+                    def on_update(sections):
+                        if time.time() - last_push[0] < 0.05: return  # 节流，避免每个 token 都推一次前端
+                        last_push[0] = time.time()
+                        for key, text in sections.items():
+                            if not text.strip(): continue
+                            if key.endswith("cn"): slots[key].info(text.strip())
+                            else: slots[key].code(text.strip())
+                    plans, ok, timing = run_generation(client, text_model, sys_msg, full_req, stream=True, on_update=on_update)
+                    live.empty()
+                else:
+                    with st.spinner('AI 构思中...'):
+                        plans, ok, timing = run_generation(client, text_model, sys_msg, full_req, stream=False)
+                if ok: get_result_cache().put(gen_key, plans)
+            p1_cn, p1_en, p2_cn, p2_en = plans["p1_cn"], plans["p1_en"], plans["p2_cn"], plans["p2_en"]
+
+            suffix = build_suffix(ratio, mode, stylize, chaos, negative_prompt)
+            st.session_state.last_results = {"p1_cn": p1_cn, "p1_en": p1_en + suffix, "p2_cn": p2_cn, "p2_en": p2_en + suffix, "timing": timing, "parsed": ok}
         except Exception as e: st.error(f"API Error: {e}")
 
     if st.session_state.last_results:
         res = st.session_state.last_results
         st.divider()
+        if res.get("timing", {}).get("cached"):
+            st.caption("⚡ 命中结果缓存，未调用模型 (点 🔄 重新生成 可强制刷新)")
+        elif "timing" in res:
+            st.caption(f"⏱️ 首字 {res['timing']['ttft']:.2f}s · 总耗时 {res['timing']['total']:.2f}s" + ("" if res.get("parsed", True) else " · ⚠️ 未完整识别方案标记"))
         col_a, col_b = st.columns(2)
         with col_a:
             st.markdown("#### 🅰️ 方案 A"); st.info(res['p1_cn']); st.code(res['p1_en'])
@@ -401,38 +1202,172 @@ with tab1:
             st.markdown("#### 🅱️ 方案 B"); st.info(res['p2_cn']); st.code(res['p2_en'])
             if st.button("❤️ 收藏 B", key="btn_b"): save_data_item({"category": "默认", "desc": res["p2_cn"][:20], "prompt": res["p2_en"]}, st.session_state.current_user)
 
+    # --- 多模型对比 ---
+    with st.expander("🆚 多模型对比 (同一输入并发发给多个模型)"):
+        compare_text = st.text_area("对比模型 (每行一个，可写成 模型@API地址)", key="compare_models",
+                                    value=get_setting("COMPARE_MODELS", f"{text_model}\ngpt-4o-mini"))
+        targets = parse_compare_targets(compare_text, base_url)
+        if st.button(f"🆚 同时生成 ({len(targets)} 个模型)", disabled=len(targets) < 2):
+            try:
+                full_req = build_request(user_input, mode, param_values)
+                urls = {url for _, url in targets}
+                clients = {url: get_llm_client(url, st.secrets["API_KEY"]) for url in urls}
+                limiters = {url: get_rate_limiter(url) for url in urls}
+                suffix = build_suffix(ratio, mode, stylize, chaos, negative_prompt)
+                progress, rows, t0 = st.empty(), [], time.time()
+                for row in run_comparison(targets, clients, limiters, spec.system, full_req):
+                    if row["plans"]:
+                        if row["parsed"]: get_result_cache().put(generation_key(spec.system, full_req, row["model"], row["base_url"]), row["plans"])
+                        row["plans"] = {k: v + suffix if k.endswith("en") else v for k, v in row["plans"].items()}
+                    rows.append(row)
+                    progress.caption(f"⏳ 已完成 {len(rows)}/{len(targets)}：{row['model']}")
+                progress.empty()
+                order = {t: i for i, t in enumerate(targets)}
+                rows.sort(key=lambda r: order[(r["model"], r["base_url"])])
+                st.session_state.compare_results = {"rows": rows, "wall": time.time() - t0}
+            except Exception as e: st.error(f"API Error: {e}")
+
+        cmp = st.session_state.get("compare_results")
+        if cmp:
+            slowest = max((r["timing"]["total"] for r in cmp["rows"] if r["timing"]), default=0.0)
+            st.caption(f"⏱️ 总用时 {cmp['wall']:.2f}s · 最慢单个模型 {slowest:.2f}s")
+            for i, (col, r) in enumerate(zip(st.columns(len(cmp["rows"])), cmp["rows"])):
+                with col:
+                    st.markdown(f"##### {r['model']}")
+                    if r["error"]:
+                        st.error(r["error"]); continue
+                    usage = r["timing"]["usage"]
+                    st.caption(f"⏱️ {r['timing']['total']:.2f}s · " + (f"🔢 {usage['prompt']}+{usage['completion']} tokens" if usage else "🔢 用量未知")
+                               + (" · ✅ 解析完整" if r["parsed"] else " · ⚠️ 解析不完整"))
+                    for tag, cn, en in (("A", "p1_cn", "p1_en"), ("B", "p2_cn", "p2_en")):
+                        st.markdown(f"**方案 {tag}**"); st.info(r["plans"][cn]); st.code(r["plans"][en])
+                        if st.button(f"❤️ 收藏 {tag}", key=f"cmp_{tag}_{i}"):
+                            save_data_item({"category": "默认", "desc": r["plans"][cn][:20], "prompt": r["plans"][en]}, st.session_state.current_user)
+
+    # --- 批量生成 ---
+    with st.expander("📦 批量生成 (多个输入 × 参数组合)"):
+        st.caption(f"当前模式：{mode}。每行一个输入，也可以上传 TXT / CSV (取 input 列，没有则取第一列)")
+        batch_text = st.text_area("批量输入", height=120, key="batch_text")
+        batch_file = st.file_uploader("上传 TXT / CSV", type=["txt", "csv"], key="batch_file")
+        grid = {}
+        grid_cols = st.columns(3)
+        for i, (key, label, tag, options) in enumerate(spec.params):
+            with grid_cols[i % 3]: grid[tag] = st.multiselect(label, options, key=f"grid_{key}")
+        batch_inputs = read_batch_inputs(batch_text, batch_file)
+        n_jobs = count_batch_jobs(batch_inputs, mode, grid)
+        max_jobs = get_setting("BATCH_MAX_JOBS", 200)
+        b1, b2 = st.columns([3, 1])
+        with b2: workers = st.number_input("并发数", 1, 16, get_setting("BATCH_WORKERS", 4), key="batch_workers")
+        with b1: st.caption(f"共 {n_jobs} 个请求" + (f"，超过上限只跑前 {max_jobs} 个" if n_jobs > max_jobs else ""))
+        if st.button("📦 开始批量生成", disabled=not n_jobs):
+            try:
+                # 只在点击时展开，且最多展开 max_jobs 个
+                jobs = list(itertools.islice(build_batch_jobs(batch_inputs, mode, grid), max_jobs))
+                client = get_llm_client(base_url, st.secrets["API_KEY"])
+                suffix = build_suffix(ratio, mode, stylize, chaos, negative_prompt)
+                progress, table, rows, t0 = st.progress(0.0), st.empty(), [], time.time()
+                for row in run_batch(jobs, client, text_model, base_url, get_rate_limiter(base_url), get_result_cache(), suffix, workers, spec.system):
+                    rows.append(row)
+                    progress.progress(len(rows) / len(jobs), text=f"{len(rows)}/{len(jobs)}")
+                    table.dataframe(pd.DataFrame(rows), hide_index=True)
+                table.empty()
+                st.session_state.batch_results = rows
+                st.toast(f"📦 批量完成 {len(rows)} 条，用时 {time.time() - t0:.1f}s")
+            except Exception as e: st.error(f"API Error: {e}")
+
+        if st.session_state.get("batch_results"):
+            df = pd.DataFrame(st.session_state.batch_results)
+            df.insert(0, "存B", False); df.insert(0, "存A", False)
+            edited = st.data_editor(df, hide_index=True, key="batch_editor",
+                                    disabled=[c for c in df.columns if c not in ("存A", "存B")])
+            e1, e2, e3 = st.columns(3)
+            export = df.drop(columns=["存A", "存B"])
+            with e1: st.download_button("📄 导出 CSV", export.to_csv(index=False).encode("utf-8-sig"), "batch_prompts.csv", "text/csv")
+            with e2: st.download_button("🧾 导出 JSON", export.to_json(orient="records", force_ascii=False), "batch_prompts.json", "application/json")
+            picked = [{"category": "批量", "desc": r["A_中文"][:20], "prompt": r["A_EN"]} for _, r in edited[edited["存A"]].iterrows()]
+            picked += [{"category": "批量", "desc": r["B_中文"][:20], "prompt": r["B_EN"]} for _, r in edited[edited["存B"]].iterrows()]
+            with e3:
+                if st.button(f"❤️ 保存所选 ({len(picked)})", disabled=not picked):
+                    save_data_items(picked, st.session_state.current_user)
+
 # --- Tab 2 ---
 with tab2:
-    up_file = st.file_uploader("上传图片", type=["jpg", "png"])
-    if up_file and st.button("🔍 反推"):
+    up_files = st.file_uploader("上传图片 (可多选，也可以上传 zip 包)", type=["jpg", "jpeg", "png", "webp", "zip"], accept_multiple_files=True)
+    with st.expander("⚙️ 图片压缩与并发 (减小上传体积和视觉 token)"):
+        ic1, ic2, ic3, ic4 = st.columns(4)
+        with ic1: img_edge = st.select_slider("最长边", [512, 768, 1024, 1536, 2048], value=get_setting("IMAGE_MAX_EDGE", 1024))
+        with ic2: img_fmt = st.selectbox("编码", ["JPEG", "WEBP"])
+        with ic3: img_quality = st.slider("质量", 50, 95, 85)
+        with ic4: img_workers = st.number_input("并发数", 1, 16, get_setting("VISION_WORKERS", 4), key="vision_workers")
+    if up_files and st.button("🔍 反推"):
         try:
-            client = OpenAI(api_key=st.secrets["API_KEY"], base_url=base_url)
-            b64 = encode_image(up_file)
-            with st.spinner('Thinking...'):
-                resp = client.chat.completions.create(model=vision_model, messages=[{"role":"user","content":[{"type":"text","text":"输出格式：\nCN: [中文]\nEN: [MJ Prompt]"},{"type":"image_url","image_url":{"url":f"data:image/jpeg;base64,{b64}"}}]}] )
-            raw = resp.choices[0].message.content
-            if "EN:" in raw:
-                cn, en = raw.split("EN:")[0].replace("CN:", "").strip(), raw.split("EN:")[1].strip()
-                st.image(up_file, width=200); st.info(cn); st.code(en)
-                if st.button("❤️ 收藏"): save_data_item({"category": "反推", "desc": cn[:20], "prompt": en}, st.session_state.current_user)
+            max_images, max_mb = get_setting("VISION_MAX_IMAGES", 50), get_setting("VISION_MAX_FILE_MB", 20)
+            images, truncated, skipped = load_uploaded_images(up_files, max_images, max_mb * 1024 * 1024)
+            if truncated: st.warning(f"一次最多 {max_images} 张，只处理前 {max_images} 张")
+            if skipped: st.warning(f"zip 里有 {len(skipped)} 个文件超过 {max_mb} MB，已跳过：{', '.join(skipped[:5])}")
+            if not images: raise ValueError("没有可处理的图片")
+            client = get_llm_client(base_url, st.secrets["API_KEY"])
+            progress, log, results, t0 = st.progress(0.0), st.empty(), [], time.time()
+            n_unique = len({hashlib.sha256(raw).hexdigest() for _, raw in images})
+            for row in run_reverse_batch(images, client, vision_model, get_rate_limiter(base_url), get_vision_cache(),
+                                         img_workers, img_edge, img_fmt, img_quality):
+                results.append(row)
+                progress.progress(len(results) / n_unique, text=f"{len(results)}/{n_unique}")
+                log.caption(f"{row['status']} {', '.join(row['names'])}" + (f"：{row['error']}" if row.get("error") else ""))
+            log.empty()
+            st.session_state.vision_results = results
+            st.toast(f"🔍 反推完成 {len(results)} 张，用时 {time.time() - t0:.1f}s")
         except Exception as e: st.error(str(e))
 
+    if st.session_state.get("vision_results"):
+        results = st.session_state.vision_results
+        done = [r for r in results if r["cn"] or r["en"]]
+        orig = sum(r["orig_bytes"] for r in results if r["status"] == "✅")
+        sent = sum(r["sent_bytes"] for r in results if r["status"] == "✅")
+        st.caption(f"成功 {len(done)} · 缓存复用 {sum(r['status'] == '⚡ 缓存' for r in results)} · 失败 {sum(r['status'] == '❌' for r in results)}"
+                   + (f" · 🗜️ 上传 {format_bytes(orig)} → {format_bytes(sent)}" if orig else ""))
+        gallery = st.columns(3)
+        for i, r in enumerate(results):
+            with gallery[i % 3]:
+                with st.container(border=True):
+                    if r.get("thumb"): st.image(r["thumb"])
+                    st.caption(f"{r['status']} {', '.join(r['names'])}")
+                    if r.get("encode_ms") is not None:
+                        st.caption(f"🗜️ 原图 {format_bytes(r['orig_bytes'])} → 发送 {format_bytes(r['sent_bytes'])} "
+                                   f"({r['size'][0]}×{r['size'][1]} {r['mime']})，编码 {r['encode_ms']:.0f} ms")
+                    if r.get("error"): st.error(r["error"])
+                    else: st.info(r["cn"]); st.code(r["en"])
+        if st.button(f"❤️ 全部保存到宝库 ({len(done)})", disabled=not done):
+            save_data_items([{"category": "反推", "desc": r["cn"][:20], "prompt": r["en"]} for r in done], st.session_state.current_user)
+
 # --- Tab 3 ---
 with tab3:
     curr_user = st.session_state.current_user
     st.markdown(f"#### 🌟 {curr_user} 的云端宝库")
     data = load_data(curr_user)
+    idx = get_library_index(curr_user, data) if data else None
     
-    col_h, col_b = st.columns([3, 1])
-    with col_b:
-        if data and HAS_DOCX:
-            docx = generate_word(data)
-            st.download_button("📥 导出 Word", data=docx, file_name=f"{curr_user}_prompts.docx", mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+    if data:
+        # 只有点了才生成；同一数据版本生成过的直接复用
+        formats = [f for f in EXPORT_FORMATS if f != "Word" or HAS_DOCX]
+        col_h, col_f, col_b = st.columns([2, 1, 1])
+        with col_f: exp_fmt = st.selectbox("导出格式", formats, label_visibility="collapsed")
+        ext, mime, _ = EXPORT_FORMATS[exp_fmt]
+        version = data_version(curr_user)
+        exp_key = f"{curr_user}:{version}:{exp_fmt}"
+        exported = get_export_cache().get(exp_key) if version else None
+        with col_b:
+            if exported is None and st.button(f"📦 生成 {exp_fmt}"):
+                with st.spinner("生成中..."):
+                    exported = export_library(data, exp_fmt)
+                if version: get_export_cache().put(exp_key, exported)
+            if exported is not None:
+                st.download_button(f"📥 导出 {exp_fmt}", data=exported, file_name=f"{curr_user}_prompts.{ext}", mime=mime)
     
     st.divider()
     with st.expander("➕ 手动添加"):
         with st.form("add_new"):
-            cats = sorted(list(set([d['category'] for d in data]))) if data else ["建筑", "人像"]
+            cats = idx.categories if data else ["建筑", "人像"]
             c_mode = st.selectbox("分类", ["📝 新建..."] + cats)
             new_c = st.text_input("新分类名") if c_mode == "📝 新建..." else c_mode
             desc = st.text_input("备注")
@@ -443,14 +1378,30 @@ with tab3:
     
     if not data: st.info("宝库是空的")
     else:
-        f_cat = st.selectbox("筛选", ["全部"] + sorted(list(set([d['category'] for d in data]))))
-        for i in range(len(data)-1, -1, -1):
+        f1, f2, f3 = st.columns([2, 2, 1])
+        with f1: f_cat = st.selectbox("筛选", ["全部"] + idx.categories)
+        with f2: query = st.text_input("🔎 搜索", placeholder="搜索备注或内容 (子串匹配，空格分隔多个词)", label_visibility="collapsed")
+        with f3: multi = st.toggle("批量删除")
+        hits = idx.search(query, None if f_cat == "全部" else f_cat)
+        # 分页：只渲染当前页的条目
+        page_size = get_setting("LIBRARY_PAGE_SIZE", 20)
+        pages = max(1, -(-len(hits) // page_size))
+        p1, p2 = st.columns([3, 1])
+        with p2: page = st.number_input("页码", 1, pages, 1, label_visibility="collapsed") if pages > 1 else 1
+        with p1: st.caption(f"共 {len(hits)} 条 · 第 {page}/{pages} 页")
+        selected = []
+        for i in hits[(page - 1) * page_size: page * page_size]:
             d = data[i]
-            if f_cat == "全部" or d['category'] == f_cat:
-                with st.container(border=True):
-                    c1, c2 = st.columns([6,1])
-                    with c1: st.markdown(f"**🏷️ [{d['category']}]** {d.get('desc','')} \n\n `{d['prompt']}`")
-                    with c2: 
-                        if st.button("🗑️", key=f"del_{i}"): delete_data_item(i, curr_user)
-
+            with st.container(border=True):
+                c1, c2 = st.columns([6,1])
+                with c1: st.markdown(f"**🏷️ [{d['category']}]** {d.get('desc','')} \n\n `{d['prompt']}`")
+                with c2: 
+                    if d.get('_pending'): st.caption("⏳")
+                    elif multi:
+                        if st.checkbox("选", key=f"chk_{d['id']}", label_visibility="collapsed"): selected.append(d['id'])
+                    elif st.button("🗑️", key=f"del_{d['id']}"): delete_data_items([d['id']], curr_user)
+        if multi and st.button(f"🗑️ 删除所选 ({len(selected)})", disabled=not selected):
+            delete_data_items(selected, curr_user)
 
+# 放在最后，面板才能统计到整次 rerun
+render_perf_panel()
@@ -0,0 +1,66 @@
+"""密码哈希：加盐 PBKDF2-SHA256，迭代次数可调；兼容旧的无盐 SHA-256 记录
+
+记录格式: pbkdf2_sha256$<迭代次数>$<盐 b64>$<哈希 b64>
+直接运行 `python auth.py` 会测一下不同迭代次数下每次登录的耗时。
+"""
+import base64
+import hashlib
+import hmac
+import os
+import sys
+import time
+
+ALGORITHM = "pbkdf2_sha256"
+DEFAULT_ITERATIONS = 200_000
+
+
+def legacy_hash(password):
+    """旧版本用的无盐 SHA-256"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def hash_password(password, iterations=DEFAULT_ITERATIONS, salt=None):
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations)
+    return f"{ALGORITHM}${iterations}${base64.b64encode(salt).decode()}${base64.b64encode(digest).decode()}"
+
+
+def verify_password(password, record):
+    if not record: return False
+    if not record.startswith(ALGORITHM + "$"):
+        return hmac.compare_digest(legacy_hash(password), record)
+    try:
+        _, iterations, salt, expected = record.split("$")
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), base64.b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(base64.b64encode(digest).decode(), expected)
+
+
+def needs_rehash(record, iterations=DEFAULT_ITERATIONS):
+    """旧格式或迭代次数和当前配置不一致时，登录成功后应该重新哈希"""
+    if not record or not record.startswith(ALGORITHM + "$"): return True
+    try: return int(record.split("$")[1]) != iterations
+    except (IndexError, ValueError): return True
+
+
+def benchmark(iterations_list=(50_000, 100_000, 200_000, 400_000, 600_000), rounds=5):
+    """每个迭代次数跑 rounds 次 verify，返回 {迭代次数: 平均毫秒}"""
+    results = {}
+    for iterations in iterations_list:
+        record = hash_password("correct horse battery staple", iterations)
+        t0 = time.perf_counter()
+        for _ in range(rounds): verify_password("correct horse battery staple", record)
+        results[iterations] = (time.perf_counter() - t0) / rounds * 1000
+    legacy = legacy_hash("correct horse battery staple")
+    t0 = time.perf_counter()
+    for _ in range(1000): verify_password("correct horse battery staple", legacy)
+    results["legacy_sha256"] = (time.perf_counter() - t0) / 1000 * 1000
+    return results
+
+
+if __name__ == "__main__":
+    custom = tuple(int(a) for a in sys.argv[1:])
+    for iterations, ms in (benchmark(custom) if custom else benchmark()).items():
+        mark = "  <- 默认" if iterations == DEFAULT_ITERATIONS else ""
+        print(f"{str(iterations):>14}  {ms:8.2f} ms/次登录{mark}")
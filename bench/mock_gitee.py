@@ -0,0 +1,119 @@
+"""本地假 Gitee contents API：GET / POST / PUT / DELETE，带 sha 校验和可注入的延迟
+
+    python bench/mock_gitee.py --port 8801 --latency 30
+
+然后在 secrets 里设 GITEE_API = "http://127.0.0.1:8801/api/v5" 即可离线跑 app.py。
+也可以在压测脚本里 MockGitee(latency=0.03).start() 直接起一个。
+"""
+import argparse
+import base64
+import hashlib
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+class MockGitee:
+    """文件内容放在内存里：path -> (bytes, sha)；calls 按方法计数"""
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        self.files, self.calls, self.latency = {}, Counter(), latency
+        self.lock = threading.Lock()
+        self._rev = itertools.count()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v5"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_calls(self):
+        with self.lock: self.calls.clear()
+
+    def seed(self, path, obj):
+        raw = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        with self.lock: self.files[path] = (raw, self._sha(raw))
+
+    def _sha(self, raw):
+        return hashlib.sha1(raw + str(next(self._rev)).encode()).hexdigest()
+
+    def handle(self, method, path, body):
+        """返回 (状态码, JSON)；写操作按 Gitee 的规则校验 sha"""
+        with self.lock:
+            self.calls[method] += 1
+            current = self.files.get(path)
+            if method == "GET":
+                if not current: return 404, {"message": "Not Found"}
+                raw, sha = current
+                return 200, {"type": "file", "path": path, "sha": sha, "size": len(raw),
+                             "encoding": "base64", "content": base64.b64encode(raw).decode()}
+            if method == "POST":
+                if current: return 400, {"message": "文件名已存在"}
+            elif method in ("PUT", "DELETE"):
+                if not current: return 404, {"message": "Not Found"}
+                if body.get("sha") != current[1]: return 409, {"message": "sha does not match"}
+            else:
+                return 405, {"message": "Method Not Allowed"}
+            if method == "DELETE":
+                del self.files[path]
+                return 200, {"commit": {}}
+            raw = base64.b64decode(body.get("content", ""))
+            sha = self._sha(raw)
+            self.files[path] = (raw, sha)
+            return (201 if method == "POST" else 200), {"content": {"path": path, "sha": sha}, "commit": {}}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _serve(self):
+                parts = urlsplit(self.path)
+                if "/contents/" not in parts.path:
+                    return self._reply(404, {"message": "Not Found"})
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                if mock.latency: time.sleep(mock.latency)
+                code, payload = mock.handle(self.command, parts.path.split("/contents/", 1)[1], body)
+                self._reply(code, payload)
+
+            def _reply(self, code, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = _serve
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地假 Gitee contents API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8801)
+    parser.add_argument("--latency", type=float, default=30, help="每个请求额外延迟 (毫秒)")
+    args = parser.parse_args()
+    mock = MockGitee(args.host, args.port, args.latency / 1000)
+    print(f"GITEE_API = {mock.url}")
+    try: mock.server.serve_forever()
+    except KeyboardInterrupt: pass
@@ -0,0 +1,124 @@
+"""本地假 OpenAI chat-completions 接口，支持 stream=True (SSE) 和非流式，带首字延迟 / 逐 token 延迟
+
+    python bench/mock_llm.py --port 8802 --latency 300 --token-delay 5
+
+侧边栏 API 地址填 http://127.0.0.1:8802/v1。文本请求按 ===PLAN_X_XX=== 格式返回两套方案，
+带图片的请求按 CN: / EN: 格式返回反推结果。
+"""
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PLAN_REPLY = ("===PLAN_A_CN===\n极简白色美术馆，清晨柔光，人视角度\n===PLAN_A_EN===\n"
+              "minimalist white art museum, soft morning light, eye-level view, photorealistic, 8k\n"
+              "===PLAN_B_CN===\n鸟瞰视角的白色美术馆，黄昏，环境融合\n===PLAN_B_EN===\n"
+              "aerial view of a white art museum at dusk, integrated with landscape, cinematic lighting\n")
+VISION_REPLY = "CN: 一座现代建筑的效果图\nEN: architectural rendering of a modern building, daylight, photorealistic"
+
+
+class MockLLM:
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, token_delay=0.0, chunk_chars=4):
+        self.latency, self.token_delay, self.chunk_chars = latency, token_delay, chunk_chars
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def reset_calls(self):
+        with self.lock: self.calls.clear()
+
+    @staticmethod
+    def reply_for(messages):
+        last = messages[-1]["content"] if messages else ""
+        return VISION_REPLY if isinstance(last, list) else PLAN_REPLY
+
+    @staticmethod
+    def usage_for(messages, text):
+        prompt = sum(len(json.dumps(m.get("content"), ensure_ascii=False)) for m in messages) // 4
+        completion = len(text) // 4
+        return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._json(404, {"error": {"message": "Not Found"}})
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                stream = bool(req.get("stream"))
+                with mock.lock: mock.calls["stream" if stream else "complete"] += 1
+                messages, model = req.get("messages", []), req.get("model", "mock")
+                text = mock.reply_for(messages)
+                if mock.latency: time.sleep(mock.latency)
+                if stream:
+                    # 和 OpenAI 一样，只有带 stream_options.include_usage 时才在最后发用量
+                    wants_usage = (req.get("stream_options") or {}).get("include_usage")
+                    self._stream(model, text, mock.usage_for(messages, text) if wants_usage else None)
+                else:
+                    self._json(200, {"id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                                     "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                                     "usage": mock.usage_for(messages, text)})
+
+            def _json(self, code, payload):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model, text, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                base = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+                step = mock.chunk_chars
+                for i in range(0, len(text), step):
+                    chunk = dict(base, choices=[{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}])
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if mock.token_delay: time.sleep(mock.token_delay)
+                events = [dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])]
+                if usage: events.append(dict(base, choices=[], usage=usage))
+                self.wfile.write("".join(f"data: {json.dumps(e)}\n\n" for e in events).encode("utf-8") + b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地假 chat-completions 接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8802)
+    parser.add_argument("--latency", type=float, default=300, help="首字前延迟 (毫秒)")
+    parser.add_argument("--token-delay", type=float, default=5, help="流式每个 chunk 之间的延迟 (毫秒)")
+    args = parser.parse_args()
+    mock = MockLLM(args.host, args.port, args.latency / 1000, args.token_delay / 1000)
+    print(f"API 地址 = {mock.url}")
+    try: mock.server.serve_forever()
+    except KeyboardInterrupt: pass
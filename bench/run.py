@@ -0,0 +1,245 @@
+"""离线压测：本地起假 Gitee + 假 LLM，按脚本跑 登录 / 生成 / 收藏×N / 加载 1 万条 / 删除 / 导出 Word，
+输出每个场景的 p50 / p95 和请求数。
+
+    python bench/run.py                       # 默认参数
+    python bench/run.py --iterations 10 --gitee-latency 80 --json bench.json
+
+app.* 场景用 streamlit 的 AppTest 整页跑 app.py (计的是一次 rerun 的耗时，包含渲染)；
+storage.* 场景直接调 storage.py，只看存储层。
+"""
+import argparse
+import base64
+import json
+import math
+import os
+import statistics
+import sys
+import time
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from auth import hash_password
+from mock_gitee import MockGitee
+from mock_llm import MockLLM
+from storage import GiteeStorage, make_session, stamp_item
+
+APP = os.path.join(ROOT, "app.py")
+PASSWORD = "bench-pass"
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))]
+
+
+def make_items(n, prefix="bench"):
+    cats = ["建筑", "人像", "室内", "景观", "默认"]
+    return [stamp_item({"category": cats[i % len(cats)], "desc": f"{prefix} {i}",
+                        "prompt": f"{prefix} prompt {i}, minimalist architecture, soft light, photorealistic --ar 16:9"})
+            for i in range(n)]
+
+
+class Bench:
+    def __init__(self, args):
+        self.args = args
+        self.gitee = MockGitee(latency=args.gitee_latency / 1000).start()
+        self.llm = MockLLM(latency=args.llm_latency / 1000, token_delay=args.token_delay / 1000).start()
+        self.results = {}   # 场景 -> {"times": [...], "calls": Counter}
+
+    # --- 工具 ---
+    def storage(self):
+        return GiteeStorage("bench", "o", "r", api=self.gitee.url, session=make_session())
+
+    def seed_library(self, username, n):
+        """不计时、不加延迟地准备数据"""
+        latency, self.gitee.latency = self.gitee.latency, 0
+        storage = self.storage()
+        storage.add_user(username, hash_password(PASSWORD, self.args.kdf_iterations))
+        items = make_items(n, username)
+        for i in range(0, len(items), 2000): storage.commit(username, adds=items[i:i + 2000])
+        self.gitee.latency = latency
+
+    def library_size(self, username):
+        raw = self.gitee.files.get(f"prompts_{username}/manifest.json")
+        return sum(c["count"] for c in json.loads(raw[0])["chunks"]) if raw else 0
+
+    def wait_size(self, username, expected, timeout=30):
+        """后台写入队列是异步的，等远端条数变成预期值"""
+        deadline = time.time() + timeout
+        while self.library_size(username) != expected and time.time() < deadline: time.sleep(0.01)
+        return self.library_size(username) == expected
+
+    def app(self, username=None, cold=True):
+        """新开一个会话；cold 时先清掉进程内所有 cache_resource (连接、读缓存、写队列...)"""
+        if cold: st.cache_resource.clear()
+        at = AppTest.from_file(APP, default_timeout=self.args.timeout)
+        at.secrets.update({"GITEE_TOKEN": "bench", "GITEE_OWNER": "o", "GITEE_REPO": "r", "API_KEY": "bench",
+                           "GITEE_API": self.gitee.url, "WRITE_DELAY": 0.0, "PASSWORD_ITERATIONS": self.args.kdf_iterations,
+                           "RATE_LIMIT_RPM": 0})
+        if username:
+            at.query_params["u"] = username
+            at.query_params["p"] = base64.b64encode(PASSWORD.encode()).decode()
+        return at
+
+    def point_to_llm(self, at):
+        next(t for t in at.text_input if t.label == "API 地址").set_value(self.llm.url)
+
+    def measure(self, name, fn, iterations):
+        """fn() 返回本次耗时 (秒)，或 (耗时, 是否写完)；请求数按整个场景累计"""
+        self.gitee.reset_calls(); self.llm.reset_calls()
+        times, failed = [], 0
+        for i in range(iterations):
+            result = fn(i)
+            elapsed, ok = result if isinstance(result, tuple) else (result, True)
+            times.append(elapsed)
+            failed += not ok
+        calls = Counter({f"gitee {k}": v for k, v in self.gitee.calls.items()})
+        calls.update({f"llm {k}": v for k, v in self.llm.calls.items()})
+        self.results[name] = {"times": times, "calls": calls, "ok": not failed, "failed": failed}
+        print(f"  {name:<24} p50 {percentile(times, 50) * 1000:8.1f} ms" + (f"  ⚠️ {failed} 次超时未写完" if failed else ""), flush=True)
+
+    @staticmethod
+    def timed_run(at):
+        t0 = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - t0
+        if at.exception: raise RuntimeError(at.exception[0].message)
+        return elapsed
+
+    # --- 场景 ---
+    def run(self):
+        a = self.args
+        user, big = "bench", "bench10k"
+        print(f"准备数据：{user} {a.library} 条，{big} {a.big_library} 条 ...", flush=True)
+        self.seed_library(user, a.library)
+        self.seed_library(big, a.big_library)
+
+        # 登录：冷启动一个会话，带 ?u=&p= 走 URL 登录 (含 KDF 校验 + 首屏加载)
+        self.measure("app.login_cold", lambda i: self.timed_run(self.app(user)), a.iterations)
+
+        at = self.app(user)
+        at.run()
+        self.point_to_llm(at)
+        at.text_area[0].input("一个极简风格的白色美术馆")
+        at.run()
+
+        def generate(i, button):
+            next(b for b in at.button if b.label == button).click()
+            return self.timed_run(at)
+        self.measure("app.generate", lambda i: generate(i, "🔄 重新生成"), a.iterations)
+        self.measure("app.generate_cached", lambda i: generate(i, "🚀 立即生成"), a.iterations)
+
+        # 收藏 ×N：每次点击的 rerun 耗时；全部写完的时间单独记一项
+        start_size = self.library_size(user)
+        def save(i):
+            next(b for b in at.button if b.key == "btn_a").click()
+            return self.timed_run(at)
+        self.measure("app.save", save, a.saves)
+        t0 = time.perf_counter()
+        ok = self.wait_size(user, start_size + a.saves)
+        self.results["app.save_sync"] = {"times": [time.perf_counter() - t0], "calls": Counter(), "ok": ok, "failed": int(not ok)}
+
+        # 加载大宝库：冷 (新会话、缓存全清) 和热 (同一会话再 rerun)
+        self.measure("app.load_10k_cold", lambda i: self.timed_run(self.app(big)), a.iterations)
+        big_at = self.app(big)
+        big_at.run()
+        self.measure("app.load_10k_warm", lambda i: self.timed_run(big_at), a.iterations)
+
+        # 删除：点一条还没删过的删除按钮，计 rerun 耗时，再等后台提交完 (没写完的次数单独报出来)
+        deleted = set()
+        def delete(i):
+            size = self.library_size(big)
+            key = next(b.key for b in big_at.button if b.key and b.key.startswith("del_") and b.key not in deleted)
+            deleted.add(key)
+            big_at.button(key=key).click()
+            elapsed = self.timed_run(big_at)
+            return elapsed, self.wait_size(big, size - 1)
+        self.measure("app.delete", delete, a.iterations)
+
+        # 导出 Word：每轮新会话，只计点 "生成" 那次 rerun
+        def export_word(i):
+            w = self.app(user)
+            w.run()
+            next(s for s in w.selectbox if "Word" in (s.options or [])).set_value("Word")
+            w.run()
+            next(b for b in w.button if b.label == "📦 生成 Word").click()
+            return self.timed_run(w)
+        self.measure("app.export_word", export_word, a.iterations)
+
+        # 存储层
+        def load_cold(i):
+            t0 = time.perf_counter()
+            version, loader = self.storage().read_prompts(big)
+            loader()
+            return time.perf_counter() - t0
+        self.measure("storage.load_10k_cold", load_cold, a.iterations)
+        warm = self.storage()
+        warm.read_prompts(big)[1]()
+        def load_warm(i):
+            t0 = time.perf_counter()
+            warm.read_prompts(big)[1]()
+            return time.perf_counter() - t0
+        self.measure("storage.load_10k_warm", load_warm, a.iterations)
+        def commit(i, **ops):
+            t0 = time.perf_counter()
+            warm.commit(big, **ops)
+            return time.perf_counter() - t0
+        added = []
+        def add_one(i):
+            item = make_items(1, "extra")[0]
+            added.append(item["id"])
+            return commit(i, adds=[item])
+        self.measure("storage.add_1", add_one, a.iterations)
+        self.measure("storage.delete_1", lambda i: commit(i, deletes=[added[i]]), a.iterations)
+
+    def report(self):
+        print(f"\n{'场景':<26}{'次数':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'均值(ms)':>10}  请求数")
+        for name, r in self.results.items():
+            t = [x * 1000 for x in r["times"]]
+            calls = ", ".join(f"{k}={v}" for k, v in sorted(r["calls"].items())) or "-"
+            flag = "" if r.get("ok", True) else f"  ⚠️ {r['failed']} 次超时未写完"
+            print(f"{name:<28}{len(t):>6}{percentile(t, 50):>10.1f}{percentile(t, 95):>10.1f}{statistics.mean(t):>10.1f}  {calls}{flag}")
+
+    def to_json(self):
+        return {"params": vars(self.args),
+                "scenarios": {name: {"n": len(r["times"]), "p50_ms": percentile(r["times"], 50) * 1000,
+                                     "p95_ms": percentile(r["times"], 95) * 1000, "mean_ms": statistics.mean(r["times"]) * 1000,
+                                     "calls": dict(r["calls"]), "ok": r.get("ok", True), "failed": r.get("failed", 0)}
+                              for name, r in self.results.items()}}
+
+    def close(self):
+        self.gitee.stop(); self.llm.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线压测 (假 Gitee + 假 LLM)")
+    parser.add_argument("--iterations", type=int, default=5, help="每个场景跑几次")
+    parser.add_argument("--saves", type=int, default=20, help="收藏场景点几次")
+    parser.add_argument("--library", type=int, default=500, help="普通用户宝库条数")
+    parser.add_argument("--big-library", type=int, default=10_000, help="大宝库条数")
+    parser.add_argument("--gitee-latency", type=float, default=30, help="假 Gitee 每请求延迟 (毫秒)")
+    parser.add_argument("--llm-latency", type=float, default=300, help="假 LLM 首字延迟 (毫秒)")
+    parser.add_argument("--token-delay", type=float, default=5, help="假 LLM 流式每 chunk 延迟 (毫秒)")
+    parser.add_argument("--kdf-iterations", type=int, default=200_000, help="PASSWORD_ITERATIONS")
+    parser.add_argument("--timeout", type=float, default=120, help="AppTest 单次 rerun 超时 (秒)")
+    parser.add_argument("--json", help="结果另存为 JSON，方便前后对比")
+    args = parser.parse_args()
+
+    bench = Bench(args)
+    try:
+        bench.run()
+        bench.report()
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f: json.dump(bench.to_json(), f, ensure_ascii=False, indent=2)
+    finally:
+        bench.close()
+
+
+if __name__ == "__main__":
+    main()
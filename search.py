@@ -0,0 +1,45 @@
+"""宝库搜索索引：每个数据版本建一次，搜索是不区分大小写的子串匹配，空格分开的多个词要同时出现
+
+倒排表按 desc/prompt 的单字 + 相邻两字 (不分中英文) 建，任何子串都能拆成这些 gram 先缩小候选，
+最后再对候选做一次子串校验。
+"""
+
+
+def _index_grams(text):
+    """每个字符和相邻两个字符 (不分中英文)；任何子串查询都能拆成这些 gram"""
+    return set(text) | {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class LibraryIndex:
+    """分类 -> 位置，以及 gram -> 位置的倒排表；search 不再每次按键扫全表"""
+    def __init__(self, data):
+        self.size = len(data)
+        self.by_category, self.postings, self.texts = {}, {}, []
+        for i, d in enumerate(data):
+            self.by_category.setdefault(d['category'], []).append(i)
+            text = f"{d.get('desc', '')}\n{d.get('prompt', '')}".lower()
+            self.texts.append(text)
+            for gram in _index_grams(text): self.postings.setdefault(gram, []).append(i)
+        self.categories = sorted(self.by_category)
+
+    def _candidates(self, term):
+        """包含 term 所有二元 gram (单字词就是这个字) 的位置，短的倒排表先求交集"""
+        grams = [term] if len(term) == 1 else {term[i:i + 2] for i in range(len(term) - 1)}
+        lists = sorted((self.postings.get(g, ()) for g in grams), key=len)
+        found = set(lists[0])
+        for lst in lists[1:]:
+            if not found: break
+            found.intersection_update(lst)
+        return found
+
+    def search(self, query="", category=None):
+        """返回匹配条目的位置，新的在前"""
+        terms = query.lower().split()
+        cand = set(self.by_category.get(category, ())) if category else None
+        for term in sorted(terms, key=len, reverse=True):
+            found = self._candidates(term)
+            cand = found if cand is None else cand & found
+            if not cand: return []
+        if cand is None: cand = range(self.size)
+        if terms: cand = [i for i in cand if all(t in self.texts[i] for t in terms)]
+        return sorted(cand, reverse=True)
@@ -0,0 +1,488 @@
+"""存储后端：Gitee 仓库 (每个用户一个 JSON 文件) 或本地 SQLite (按行增删)
+
+读接口返回 (version, loader)：version 用来判断缓存是否还有效 (Gitee 用 blob sha，
+SQLite 用修订号)，loader() 才真正解析数据，版本没变时上层可以跳过解析。
+"""
+import base64
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+GITEE_API = "https://gitee.com/api/v5"
+SHARD_SIZE = 500  # 每个分片文件最多多少条提示词
+DEFAULT_TIMEOUT = (5, 30)  # (连接, 读取) 秒
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageConflict(StorageError):
+    """写入时 sha 已过期 (别的会话先写了)，重新读取后再合并即可"""
+
+
+def make_session(retries=3, backoff=0.3, pool_size=16):
+    """带连接池 (keep-alive) 和退避重试的 Session。状态码重试只针对 GET，PUT 只在连不上时重试"""
+    session = requests.Session()
+    retry = Retry(total=retries, connect=retries, read=0, backoff_factor=backoff,
+                  status_forcelist=[429, 500, 502, 503, 504], allowed_methods=["GET"], raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def user_filename(username):
+    return f"prompts_{username}.json"
+
+
+def new_item_id():
+    """按时间有序的短 id (微秒时间戳 + 随机后缀)"""
+    return f"{time.time_ns() // 1000:014x}{os.urandom(2).hex()}"
+
+
+def stamp_item(item):
+    """保存时补上稳定 id 和创建时间"""
+    item = dict(item)
+    item.setdefault("id", new_item_id())
+    item.setdefault("created", time.strftime("%Y-%m-%d %H:%M:%S"))
+    return item
+
+
+def ensure_ids(items):
+    """给旧数据补 id：按内容哈希生成，与位置无关，迁移写回失败也能得到同样的 id；返回是否有改动"""
+    seen, changed = {}, False
+    for d in items:
+        if d.get("id"): continue
+        key = json.dumps([d.get("category"), d.get("desc"), d.get("prompt")], ensure_ascii=False)
+        base = "m" + hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+        n = seen[base] = seen.get(base, -1) + 1
+        d["id"] = f"{base}-{n}" if n else base
+        changed = True
+    return changed
+
+
+# ================= 🔌 后端接口 =================
+
+class Storage:
+    """两个后端共同的接口，app.py 只通过这些方法访问存储。
+    读接口返回 (version, loader)；version 为 None 表示还没有数据，loader() 返回解析好的数据"""
+    name = ""
+    ready = False  # 配置齐了才可用 (Gitee 需要 token)
+
+    # --- 提示词 ---
+    def read_prompts(self, username, category=None):
+        """(version, loader)；loader() 返回该用户的提示词列表，给了 category 时只返回这个分类的"""
+        raise NotImplementedError
+
+    def load_prompts(self, username, category=None):
+        return self.read_prompts(username, category)[1]()
+
+    def commit(self, username, adds=(), deletes=()):
+        """一次提交多条新增 (条目) 和删除 (id)，返回实际删除条数；并发写冲突时抛 StorageConflict"""
+        raise NotImplementedError
+
+    def add_prompt(self, username, item):
+        self.commit(username, adds=[item])
+
+    def delete_prompt(self, username, item_id):
+        return self.commit(username, deletes=[item_id]) > 0
+
+    # --- 用户 ---
+    def user_shard(self, username):
+        """用户记录所在的分片名，也用作读缓存的 key"""
+        raise NotImplementedError
+
+    def read_users(self, shard):
+        """(version, loader)；loader() 返回 {用户名: 密码哈希}，至少包含这个分片里的用户"""
+        raise NotImplementedError
+
+    def add_user(self, username, pw_hash):
+        """新建用户，已存在返回 False"""
+        raise NotImplementedError
+
+    def set_user(self, username, pw_hash):
+        """更新已有用户的密码哈希，用户不存在返回 False"""
+        raise NotImplementedError
+
+
+# ================= ☁️ Gitee =================
+
+def user_dir(username):
+    return f"prompts_{username}"
+
+
+def chunk_entry(name, sha, items):
+    """manifest 里每个分片的摘要：id 范围用来定位删除，分类计数用来按分类只读需要的分片"""
+    ids = [d["id"] for d in items]
+    cats = {}
+    for d in items: cats[d.get("category", "")] = cats.get(d.get("category", ""), 0) + 1
+    return {"file": name, "sha": sha, "count": len(items),
+            "min_id": min(ids) if ids else "", "max_id": max(ids) if ids else "", "categories": cats}
+
+
+class GiteeStorage(Storage):
+    """分片布局：prompts_{用户}/manifest.json + 固定大小的 chunk_00000.json ...；
+    用户表按用户名哈希分到 users/{0-f}.json。读只拉 manifest 和变了的分片，写只动一个分片 + manifest。
+    旧的单文件 prompts_{用户}.json / users.json 在第一次访问时自动迁移 (旧文件保留作备份)"""
+    name = "gitee"
+    set_user_retries = 2  # set_user 遇到分片并发修改时重读重试几次
+
+    def __init__(self, token, owner, repo, api=GITEE_API, session=None, timeout=DEFAULT_TIMEOUT,
+                 shard_size=SHARD_SIZE, chunk_cache_size=256):
+        self.token, self.owner, self.repo, self.api = token, owner, repo, api.rstrip("/")
+        self.session, self.timeout = session or make_session(), timeout
+        self.shard_size, self.chunk_cache_size = shard_size, chunk_cache_size
+        self._chunks = OrderedDict()  # 分片 sha -> 解析好的条目，sha 没变就不用再 GET
+        self._chunk_lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return bool(self.token)
+
+    def _url(self, filename):
+        return f"{self.api}/repos/{self.owner}/{self.repo}/contents/{filename}"
+
+    def _get(self, filename):
+        """返回 (sha, content_b64)，文件不存在时返回 (None, None)"""
+        res = self.session.get(self._url(filename), params={"access_token": self.token}, timeout=self.timeout)
+        if res.status_code == 200:
+            info = res.json()
+            return info['sha'], info['content']
+        if res.status_code == 404:
+            return None, None
+        raise StorageError(f"读取 {filename} 失败: {res.status_code} {res.text}")
+
+    def _put(self, filename, data, sha, message, indent=4):
+        """有 sha 时 PUT 更新，没有时 POST 新建；返回新的 sha"""
+        new_b64 = base64.b64encode(json.dumps(data, ensure_ascii=False, indent=indent).encode('utf-8')).decode('utf-8')
+        payload = {"access_token": self.token, "content": new_b64, "message": message}
+        if sha:
+            payload["sha"] = sha
+            res = self.session.put(self._url(filename), json=payload, timeout=self.timeout)
+        else:
+            res = self.session.post(self._url(filename), json=payload, timeout=self.timeout)
+        text = res.text.lower()
+        if res.status_code == 409 or (res.status_code in [400, 422] and ("sha" in text or "exist" in text or "已存在" in text)):
+            raise StorageConflict(f"{filename} 已被修改")
+        if res.status_code not in [200, 201]:
+            raise StorageError(f"写入 {filename} 失败: {res.text}")
+        try: return res.json()["content"]["sha"]
+        except (ValueError, KeyError, TypeError): return None
+
+    @staticmethod
+    def _decode(content, default):
+        if content is None: return default
+        return json.loads(base64.b64decode(content).decode('utf-8'))
+
+    # --- 分片缓存 ---
+    def _cached_chunk(self, sha):
+        with self._chunk_lock:
+            items = self._chunks.get(sha) if sha else None
+            if items is not None: self._chunks.move_to_end(sha)
+            return items
+
+    def _remember_chunk(self, sha, items):
+        if not sha: return
+        with self._chunk_lock:
+            self._chunks[sha] = items
+            while len(self._chunks) > self.chunk_cache_size: self._chunks.popitem(last=False)
+
+    def _forget_chunk(self, sha):
+        with self._chunk_lock: self._chunks.pop(sha, None)
+
+    def _load_chunk(self, username, entry):
+        items = self._cached_chunk(entry["sha"])
+        if items is None:
+            sha, content = self._get(f"{user_dir(username)}/{entry['file']}")
+            items = self._decode(content, [])
+            self._remember_chunk(sha, items)
+        return items
+
+    # --- 提示词 ---
+    def _read_manifest(self, username):
+        """返回 (manifest_sha, manifest)；没有 manifest 时迁移旧单文件，迁移失败则 manifest 为 None、附带旧数据"""
+        sha, content = self._get(f"{user_dir(username)}/manifest.json")
+        if sha: return sha, self._decode(content, {"chunks": []}), None
+        legacy_sha, legacy = self._get(user_filename(username))
+        if legacy_sha is None: return None, {"chunks": []}, None
+        data = self._decode(legacy, [])
+        ensure_ids(data)
+        try:
+            return (*self._migrate(username, data), None)
+        except StorageConflict:
+            # manifest 已被别的会话先写了：迁移已完成，直接用它的
+            sha, content = self._get(f"{user_dir(username)}/manifest.json")
+            if sha: return sha, self._decode(content, {"chunks": []}), None
+        except StorageError:
+            pass
+        # 这次没迁成 (网络错误等)，先直接用旧文件，下次读时从头再迁
+        return f"legacy:{legacy_sha}", None, data
+
+    def _upsert(self, filename, data, message, indent=4):
+        """新建文件；已存在 (上次迁移中断留下的) 时按它当前的 sha 覆盖"""
+        try:
+            return self._put(filename, data, None, message, indent=indent)
+        except StorageConflict:
+            sha, _ = self._get(filename)
+            return self._put(filename, data, sha, message, indent=indent)
+
+    def _migrate(self, username, data):
+        """先写分片再写 manifest；分片内容只由旧文件决定，中断后重跑会覆盖掉残留分片"""
+        manifest = {"version": 1, "chunks": []}
+        for n, start in enumerate(range(0, len(data), self.shard_size)):
+            items, name = data[start:start + self.shard_size], f"chunk_{n:05d}.json"
+            sha = self._upsert(f"{user_dir(username)}/{name}", items, f"Shard {name} for {username}", indent=None)
+            self._remember_chunk(sha, items)
+            manifest["chunks"].append(chunk_entry(name, sha, items))
+        manifest["next"] = len(manifest["chunks"])
+        return self._put(f"{user_dir(username)}/manifest.json", manifest, None, f"Shard library of {username}"), manifest
+
+    def read_prompts(self, username, category=None):
+        sha, manifest, legacy = self._read_manifest(username)
+        def loader():
+            if manifest is None:
+                return [d for d in legacy if category is None or d.get('category') == category]
+            items = []
+            for entry in manifest["chunks"]:
+                if category is None: items.extend(self._load_chunk(username, entry))
+                elif category in entry["categories"]:
+                    items.extend(d for d in self._load_chunk(username, entry) if d.get('category') == category)
+            return items
+        return sha, loader
+
+    def commit(self, username, adds=(), deletes=()):
+        """增删合并成一次提交：只改涉及的分片 (通常就一个) + manifest，返回实际删除条数；sha 冲突抛 StorageConflict。
+        重试是幂等的：已经写进分片的 id 不会重复添加，manifest 落后于分片时即使没有条目变化也会补写"""
+        folder = f"{user_dir(username)}/"
+        m_sha, manifest, legacy = self._read_manifest(username)
+        if manifest is None: raise StorageConflict(f"{username} 的宝库正在迁移")
+        adds, deletes = [stamp_item(item) for item in adds], set(deletes)
+        touched = OrderedDict()  # file -> [entry, items, sha, changed]
+
+        def open_chunk(entry):
+            if entry["file"] not in touched:
+                items = self._cached_chunk(entry.get("sha"))
+                sha = entry.get("sha")
+                if items is None: sha, content = self._get(folder + entry["file"]); items = self._decode(content, [])
+                touched[entry["file"]] = [entry, list(items), sha, False]
+            return touched[entry["file"]]
+
+        for entry in manifest["chunks"]:
+            if any(entry["min_id"] <= i <= entry["max_id"] for i in deletes): open_chunk(entry)
+        removed = 0
+        for t in touched.values():
+            kept = [d for d in t[1] if d["id"] not in deletes]
+            if len(kept) != len(t[1]): removed += len(t[1]) - len(kept); t[1], t[3] = kept, True
+
+        def new_chunk():
+            # 上次失败留下的同名孤儿分片也会被 open_chunk 读出来，按 id 去重后合并
+            n = manifest.get("next", len(manifest["chunks"]))
+            manifest["next"] = n + 1
+            manifest["chunks"].append({"file": f"chunk_{n:05d}.json", "sha": None, "count": 0, "min_id": "", "max_id": "", "categories": {}})
+            return open_chunk(manifest["chunks"][-1])
+
+        if adds:
+            chunks = manifest["chunks"]
+            t = open_chunk(chunks[-1]) if chunks and chunks[-1]["count"] < self.shard_size else new_chunk()
+            seen = {d["id"] for d in t[1]}
+            for item in adds:
+                if item["id"] in seen: continue
+                if len(t[1]) >= self.shard_size:
+                    t = new_chunk()
+                    seen = {d["id"] for d in t[1]}
+                    if item["id"] in seen: continue
+                t[1].append(item); t[3] = True
+                seen.add(item["id"])
+
+        changed = [t for t in touched.values() if t[3]]
+        # 上次分片写成了、manifest 没写成：分片里已经有这些 id，但 manifest 记的还是旧 sha / 计数 (或根本没这个分片)
+        stale = [t for t in touched.values() if not t[3] and t[2] != t[0].get("sha")]
+        if not changed and not stale: return removed
+        for entry, items, sha, _ in stale:
+            self._remember_chunk(sha, items)
+            entry.update(chunk_entry(entry["file"], sha, items))
+        msg = f"Sync by {username} (+{len(adds)} -{removed})"
+        for entry, items, sha, _ in changed:
+            try:
+                new_sha = self._put(folder + entry["file"], items, sha, msg, indent=None)
+            except StorageConflict:
+                self._forget_chunk(sha)  # 缓存的分片已过期，下次重试重新 GET
+                raise
+            self._remember_chunk(new_sha, items)
+            entry.update(chunk_entry(entry["file"], new_sha, items))
+        manifest["chunks"] = [e for e in manifest["chunks"] if e.get("sha")]  # 新开了但最终没写的空分片不记
+        self._put(folder + "manifest.json", manifest, m_sha, msg)
+        return removed
+
+    # --- 用户 ---
+    def user_shard(self, username):
+        return f"users/{hashlib.sha1(username.encode('utf-8')).hexdigest()[:1]}.json"
+
+    def _legacy_users(self, shard):
+        """旧 users.json 里属于这个分片的用户，分片第一次写入时一起带过去"""
+        sha, content = self._get("users.json")
+        users = self._decode(content, {})
+        # 🛠️ 如果不小心存成了列表[]，强制转为字典{}
+        if isinstance(users, list): users = {}
+        return sha, {u: r for u, r in users.items() if self.user_shard(u) == shard}
+
+    def read_users(self, shard):
+        sha, content = self._get(shard)
+        if sha: return sha, lambda: self._decode(content, {})
+        legacy_sha, users = self._legacy_users(shard)
+        return (f"legacy:{legacy_sha}" if legacy_sha else None), lambda: users
+
+    def _load_shard(self, shard):
+        sha, content = self._get(shard)
+        return sha, (self._decode(content, {}) if sha else self._legacy_users(shard)[1])
+
+    def add_user(self, username, pw_hash):
+        """读一次分片、写一次；已存在返回 False"""
+        shard = self.user_shard(username)
+        sha, users = self._load_shard(shard)
+        if username in users: return False
+        users[username] = pw_hash
+        self._put(shard, users, sha, f"Register user {username}")
+        return True
+
+    def set_user(self, username, pw_hash):
+        """更新已有用户的密码哈希 (登录时升级旧哈希用)，分片被并发改了就重读重试"""
+        shard = self.user_shard(username)
+        for attempt in range(self.set_user_retries + 1):
+            sha, users = self._load_shard(shard)
+            if username not in users: return False
+            users[username] = pw_hash
+            try:
+                self._put(shard, users, sha, f"Rehash user {username}")
+                return True
+            except StorageConflict:
+                if attempt == self.set_user_retries: raise
+
+
+# ================= 💾 本地 SQLite =================
+
+class SQLiteStorage(Storage):
+    """本地离线后端：一条提示词一行，(username, category) 建索引，增删不再重写整个文件"""
+    name = "sqlite"
+    ready = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS prompts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        category TEXT NOT NULL,
+        data TEXT NOT NULL,
+        item_id TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_prompts_user_cat ON prompts (username, category);
+    CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, pw_hash TEXT NOT NULL);
+    CREATE TABLE IF NOT EXISTS revisions (name TEXT PRIMARY KEY, rev INTEGER NOT NULL);
+    """
+
+    def __init__(self, path="prompts.db"):
+        self.path = path
+        self.lock = threading.Lock()
+        if os.path.dirname(path): os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._migrate(conn)
+
+    def _migrate(self, conn):
+        """老库没有 item_id 列 / 行里没有 id 的，补上"""
+        if "item_id" not in [r[1] for r in conn.execute("PRAGMA table_info(prompts)")]:
+            conn.execute("ALTER TABLE prompts ADD COLUMN item_id TEXT")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_prompts_user_item ON prompts (username, item_id)")
+        users = [r[0] for r in conn.execute("SELECT DISTINCT username FROM prompts WHERE item_id IS NULL")]
+        for username in users:
+            rows = conn.execute("SELECT id, data FROM prompts WHERE username = ? ORDER BY id", (username,)).fetchall()
+            items = [json.loads(r[1]) for r in rows]
+            ensure_ids(items)
+            conn.executemany("UPDATE prompts SET data = ?, item_id = ? WHERE id = ?",
+                             [(json.dumps(d, ensure_ascii=False), d["id"], r[0]) for r, d in zip(rows, items)])
+            self._bump(conn, user_filename(username))
+
+    @contextmanager
+    def _conn(self):
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn: yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _bump(conn, name):
+        conn.execute("INSERT INTO revisions (name, rev) VALUES (?, 1) "
+                     "ON CONFLICT(name) DO UPDATE SET rev = rev + 1", (name,))
+
+    def _version(self, name):
+        with self._conn() as conn:
+            row = conn.execute("SELECT rev FROM revisions WHERE name = ?", (name,)).fetchone()
+        return f"{name}@{row[0]}" if row else None
+
+    # --- 提示词 ---
+    def read_prompts(self, username, category=None):
+        return self._version(user_filename(username)), lambda: self.load_prompts(username, category)
+
+    def load_prompts(self, username, category=None):
+        sql, args = "SELECT data FROM prompts WHERE username = ?", [username]
+        if category is not None:
+            sql += " AND category = ?"; args.append(category)
+        with self._conn() as conn:
+            return [json.loads(r[0]) for r in conn.execute(sql + " ORDER BY id", args)]
+
+    def commit(self, username, adds=(), deletes=()):
+        """一个事务里完成多条增删 (deletes 为 id 集合)，返回实际删除条数"""
+        adds = [stamp_item(item) for item in adds]
+        with self.lock, self._conn() as conn:
+            removed = sum(conn.execute("DELETE FROM prompts WHERE username = ? AND item_id = ?", (username, item_id)).rowcount
+                          for item_id in set(deletes))
+            conn.executemany("INSERT INTO prompts (username, category, data, item_id) VALUES (?, ?, ?, ?)",
+                             [(username, item.get('category', ''), json.dumps(item, ensure_ascii=False), item["id"]) for item in adds])
+            if adds or removed: self._bump(conn, user_filename(username))
+            return removed
+
+    # --- 用户 ---
+    def user_shard(self, username):
+        return f"user:{username}"
+
+    def read_users(self, shard):
+        """本地库按主键直接查一个用户"""
+        username = shard.split(":", 1)[1]
+        def loader():
+            with self._conn() as conn:
+                return dict(conn.execute("SELECT username, pw_hash FROM users WHERE username = ?", (username,)))
+        return self._version("users.json"), loader
+
+    def add_user(self, username, pw_hash):
+        with self.lock, self._conn() as conn:
+            cur = conn.execute("INSERT OR IGNORE INTO users (username, pw_hash) VALUES (?, ?)", (username, pw_hash))
+            if not cur.rowcount: return False
+            self._bump(conn, "users.json")
+            return True
+
+    def set_user(self, username, pw_hash):
+        with self.lock, self._conn() as conn:
+            cur = conn.execute("UPDATE users SET pw_hash = ? WHERE username = ?", (pw_hash, username))
+            if not cur.rowcount: return False
+            self._bump(conn, "users.json")
+            return True
+
+
+def create_storage(backend="gitee", **cfg):
+    """按配置返回一个 Storage 实现"""
+    if backend == "sqlite":
+        return SQLiteStorage(cfg.get("path") or "prompts.db")
+    return GiteeStorage(cfg.get("token", ""), cfg.get("owner", ""), cfg.get("repo", ""), cfg.get("api") or GITEE_API,
+                        session=cfg.get("session"), timeout=cfg.get("timeout") or DEFAULT_TIMEOUT,
+                        shard_size=cfg.get("shard_size") or SHARD_SIZE)
@@ -0,0 +1,33 @@
+"""存储层测试共用：本地假 Gitee + 故障注入"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from mock_gitee import MockGitee
+from storage import GiteeStorage, StorageError, make_session
+
+
+@pytest.fixture
+def gitee():
+    mock = MockGitee().start()
+    yield mock
+    mock.stop()
+
+
+def make_storage(mock, shard_size=2):
+    return GiteeStorage("t", "o", "r", api=mock.url, session=make_session(retries=0), shard_size=shard_size)
+
+
+def fail_put_once(storage, nth):
+    """第 nth 次 _put 抛一次 StorageError (模拟超时 / 5xx)"""
+    real, calls = storage._put, [0]
+    def put(*args, **kwargs):
+        calls[0] += 1
+        if calls[0] == nth: raise StorageError("injected")
+        return real(*args, **kwargs)
+    storage._put = put
@@ -0,0 +1,27 @@
+"""宝库搜索：不区分大小写的子串匹配，和词边界、字符集无关"""
+from search import LibraryIndex
+
+
+def make_index(*descs):
+    return LibraryIndex([{"category": "建筑" if i % 2 else "人像", "desc": d, "prompt": ""} for i, d in enumerate(descs)])
+
+
+def test_substring_inside_word():
+    idx = make_index("White Warehouse", "house on a hill", "greenhouse")
+    assert idx.search("house") == [2, 1, 0]
+    assert idx.search("WARE") == [0]
+
+
+def test_non_ascii_and_cjk():
+    idx = make_index("café terrace", "极简风格的白色美术馆", "美术")
+    assert idx.search("é") == [0]
+    assert idx.search("美术馆") == [1]
+    assert idx.search("术") == [2, 1]
+
+
+def test_terms_and_category_combine():
+    idx = make_index("white house", "white tower", "black house", "white house roof")
+    assert idx.search("white house") == [3, 0]
+    assert idx.search("white house", category="建筑") == [3]
+    assert idx.search("") == [3, 2, 1, 0]
+    assert idx.search("nothing") == []
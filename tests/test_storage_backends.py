@@ -0,0 +1,34 @@
+"""两个后端按同一个 Storage 接口调用，行为一致"""
+import pytest
+
+from conftest import make_storage
+from storage import GiteeStorage, SQLiteStorage, Storage, create_storage
+
+
+@pytest.fixture(params=["gitee", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "sqlite": return create_storage("sqlite", path=str(tmp_path / "t.db"))
+    return make_storage(request.getfixturevalue("gitee"))
+
+
+def test_backends_share_interface():
+    assert issubclass(GiteeStorage, Storage) and issubclass(SQLiteStorage, Storage)
+
+
+def test_prompts_by_category(storage):
+    storage.commit("u", adds=[{"id": f"i{n}", "category": "建筑" if n % 2 else "人像", "desc": "", "prompt": f"p{n}"}
+                              for n in range(5)])
+    version, loader = storage.read_prompts("u", category="建筑")
+    assert version and [d["id"] for d in loader()] == ["i1", "i3"]
+    assert [d["id"] for d in storage.load_prompts("u", "人像")] == ["i0", "i2", "i4"]
+    assert storage.delete_prompt("u", "i3") and not storage.delete_prompt("u", "i3")
+    assert [d["id"] for d in storage.load_prompts("u")] == ["i0", "i1", "i2", "i4"]
+
+
+def test_users(storage):
+    shard = storage.user_shard("alice")
+    assert storage.set_user("alice", "h0") is False
+    assert storage.add_user("alice", "h1") and not storage.add_user("alice", "h2")
+    assert storage.read_users(shard)[1]()["alice"] == "h1"
+    assert storage.set_user("alice", "h3")
+    assert storage.read_users(shard)[1]()["alice"] == "h3"
@@ -0,0 +1,56 @@
+"""分片提交的重试：分片写成、manifest 没写成之后，重试要把 manifest 补上"""
+import json
+
+from conftest import fail_put_once, make_storage
+
+
+def manifest(mock, username):
+    return json.loads(mock.files[f"prompts_{username}/manifest.json"][0])
+
+
+def test_retry_writes_manifest_for_new_user(gitee):
+    storage = make_storage(gitee)
+    fail_put_once(storage, 2)   # chunk_00000 POST 成功，manifest POST 失败
+    item = {"id": "a1", "category": "建筑", "desc": "d", "prompt": "p"}
+    try: storage.commit("carol", adds=[item])
+    except Exception: pass
+    assert "prompts_carol/manifest.json" not in gitee.files
+
+    # 写入队列原样重试 (新进程)
+    assert make_storage(gitee).commit("carol", adds=[item]) == 0
+    assert [d["id"] for d in make_storage(gitee).load_prompts("carol")] == ["a1"]
+    assert [c["count"] for c in manifest(gitee, "carol")["chunks"]] == [1]
+
+
+def test_retry_refreshes_stale_manifest_entry(gitee):
+    storage = make_storage(gitee, shard_size=3)
+    storage.commit("dave", adds=[{"id": "a1", "category": "建筑", "desc": "d", "prompt": "p1"}])
+    fail_put_once(storage, 2)   # 分片 PUT 成功，manifest PUT 失败
+    item = {"id": "b2", "category": "人像", "desc": "d", "prompt": "p2"}
+    try: storage.commit("dave", adds=[item])
+    except Exception: pass
+    assert manifest(gitee, "dave")["chunks"][0]["count"] == 1
+
+    retry = make_storage(gitee, shard_size=3)
+    retry.commit("dave", adds=[item])
+    entry = manifest(gitee, "dave")["chunks"][0]
+    assert entry["sha"] == gitee.files["prompts_dave/chunk_00000.json"][1]
+    assert (entry["count"], entry["max_id"], entry["categories"]) == (2, "b2", {"建筑": 1, "人像": 1})
+    assert [d["id"] for d in retry.load_prompts("dave", "人像")] == ["b2"]
+
+    # manifest 的 id 范围对了，这条才能删掉
+    assert make_storage(gitee, shard_size=3).commit("dave", deletes=["b2"]) == 1
+    assert [d["id"] for d in make_storage(gitee).load_prompts("dave")] == ["a1"]
+
+
+def test_retry_with_spilled_chunk(gitee):
+    storage = make_storage(gitee)
+    storage.commit("erin", adds=[{"id": "a1", "category": "c", "desc": "", "prompt": "p"}])
+    items = [{"id": f"b{i}", "category": "c", "desc": "", "prompt": "p"} for i in range(3)]
+    fail_put_once(storage, 3)   # chunk_00000 PUT、chunk_00001 POST 成功，manifest PUT 失败
+    try: storage.commit("erin", adds=items)
+    except Exception: pass
+
+    make_storage(gitee).commit("erin", adds=items)
+    assert [c["file"] for c in manifest(gitee, "erin")["chunks"]] == ["chunk_00000.json", "chunk_00001.json"]
+    assert [d["id"] for d in make_storage(gitee).load_prompts("erin")] == ["a1", "b0", "b1", "b2"]
@@ -0,0 +1,47 @@
+"""旧单文件 -> 分片布局的迁移：中断后重试要能接着完成，不能永久卡在旧文件上"""
+from conftest import fail_put_once, make_storage
+
+
+def test_interrupted_migration_resumes(gitee):
+    legacy = [{"category": "建筑", "desc": f"d{i}", "prompt": f"p{i}"} for i in range(5)]
+    gitee.seed("prompts_alice.json", legacy)
+
+    storage = make_storage(gitee)
+    fail_put_once(storage, 2)   # chunk_00000 已写入，chunk_00001 失败
+    version, loader = storage.read_prompts("alice")
+    assert version.startswith("legacy:")
+    assert [d["prompt"] for d in loader()] == [d["prompt"] for d in legacy]
+    assert "prompts_alice/chunk_00000.json" in gitee.files
+    assert "prompts_alice/manifest.json" not in gitee.files
+
+    # 重试 (新进程、没有分片缓存)：残留分片被覆盖，manifest 写出来
+    storage = make_storage(gitee)
+    version, loader = storage.read_prompts("alice")
+    assert not version.startswith("legacy:")
+    assert [d["prompt"] for d in loader()] == [d["prompt"] for d in legacy]
+    assert "prompts_alice/manifest.json" in gitee.files
+
+    # 迁移完成后可以正常增删
+    first = loader()[0]["id"]
+    storage.commit("alice", adds=[{"category": "默认", "desc": "new", "prompt": "p_new"}], deletes=[first])
+    prompts = [d["prompt"] for d in make_storage(gitee).load_prompts("alice")]
+    assert prompts == [d["prompt"] for d in legacy[1:]] + ["p_new"]
+
+
+def test_concurrent_migration_uses_existing_manifest(gitee):
+    gitee.seed("prompts_bob.json", [{"category": "建筑", "desc": "d", "prompt": "p"}])
+    first, second = make_storage(gitee), make_storage(gitee)
+    first.read_prompts("bob")
+    # 第二个会话没看到 manifest 就开始迁移 (manifest POST 冲突)，应该直接采用已有的
+    real_get, skipped = second._get, []
+    def get(filename):
+        if filename.endswith("manifest.json") and not skipped:
+            skipped.append(filename)
+            return None, None
+        return real_get(filename)
+    second._get = get
+    version, loader = second.read_prompts("bob")
+    assert version == gitee.files["prompts_bob/manifest.json"][1]
+    assert [d["prompt"] for d in loader()] == ["p"]
+    second.commit("bob", adds=[{"category": "默认", "desc": "n", "prompt": "p2"}])
+    assert [d["prompt"] for d in make_storage(gitee).load_prompts("bob")] == ["p", "p2"]